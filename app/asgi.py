@@ -3,5 +3,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# Async read path of the movies API, all other URLs are the same as under uwsgi.
+os.environ.setdefault('DJANGO_ROOT_URLCONF', 'config.urls_asgi')
 
 application = get_asgi_application()
@@ -0,0 +1,35 @@
+# Caches
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+# Movies API responses: `locmem://` keeps them in every process, `redis://host:port/db` shares them between processes.
+MOVIES_API_CACHE_URL = os.environ.get('MOVIES_API_CACHE_URL', 'locmem://')
+
+if MOVIES_API_CACHE_URL.startswith(('redis://', 'rediss://', 'unix://')):
+    # LRU eviction is up to the server: run it with `maxmemory-policy allkeys-lru`.
+    movies_api_cache = {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': MOVIES_API_CACHE_URL,
+    }
+else:
+    # LocMemCache evicts least recently used entries above MAX_ENTRIES.
+    movies_api_cache = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'movies_api',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('MOVIES_API_CACHE_MAX_ENTRIES', 1000)),
+        },
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'movies_api': movies_api_cache,
+}
+
+MOVIES_API_CACHE = {
+    'ENABLED': os.environ.get('MOVIES_API_CACHE_ENABLED', 'True') == 'True',
+    'ALIAS': 'movies_api',
+    # Entries are keyed by the last change in PG. The timeout is a safety net for changes that don't touch updated_at.
+    'TIMEOUT': int(os.environ.get('MOVIES_API_CACHE_TIMEOUT_SEC', 5 * 60)),
+}
@@ -29,6 +29,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'movies.apps.MoviesConfig',
     'debug_toolbar',
     'django_extensions',
@@ -52,7 +53,8 @@ if DEBUG:
         'debug_toolbar.middleware.DebugToolbarMiddleware',
     ]
 
-ROOT_URLCONF = 'config.urls'
+# The ASGI server serves the movies API with async views, see asgi.py.
+ROOT_URLCONF = os.environ.get('DJANGO_ROOT_URLCONF', 'config.urls')
 
 TEMPLATES = [
     {
@@ -120,3 +122,17 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 ALLOWED_HOSTS = [gethostname(), '127.0.0.1'] + list(set(gethostbyname_ex(gethostname())[2]))
+
+# Movies API builds genres and persons lists in PG, in a single query. False falls back to nested serializers.
+MOVIES_API_AGGREGATE_IN_PG = os.environ.get('MOVIES_API_AGGREGATE_IN_PG', 'True') == 'True'
+
+# Admin changelists of large tables: estimated counts instead of COUNT(*) on every page.
+ADMIN_PERFORMANCE_MODE = os.environ.get('ADMIN_PERFORMANCE_MODE', 'True') == 'True'
+
+# Admin autocomplete of persons and genres: max results, and an in-process LRU cache of the latest terms.
+# Entries are keyed by the last change of persons or genres. Deleted ones may be offered for up to the TTL.
+ADMIN_AUTOCOMPLETE = {
+    'LIMIT': int(os.environ.get('ADMIN_AUTOCOMPLETE_LIMIT', 20)),
+    'CACHE_SIZE': int(os.environ.get('ADMIN_AUTOCOMPLETE_CACHE_SIZE', 1000)),
+    'CACHE_TTL': int(os.environ.get('ADMIN_AUTOCOMPLETE_CACHE_TTL_SEC', 60)),
+}
@@ -1,14 +1,29 @@
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# Pool of connections shared by threads of a uwsgi process. Django closes connections after every request then,
+# which returns them to the pool.
+DB_POOL = os.environ.get('DB_POOL', 'False') == 'True'
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # Django PostgreSQL backend with connection health checks and an optional pool.
+        'ENGINE': 'config.db_backend',
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASSWORD'),
         'HOST': os.environ.get('DB_HOST', '127.0.0.1'),
         'PORT': os.environ.get('DB_PORT', 5432),
+        # Seconds to keep a connection open between requests, to save connect, auth and search_path setup.
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
+        'POOL': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 1)),
+            # At least uwsgi threads per process. Threads above it wait for a free connection
+            # for `timeout` seconds, and then fail the request with a database error.
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 4)),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT_SEC', 30)),
+        } if DB_POOL else None,
         'OPTIONS': {
             # Нужно явно указать схемы, с которыми будет работать приложение.
             'options': '-c search_path=public,content'
@@ -16,6 +31,12 @@ DATABASES = {
     }
 }
 
+# Async PG connections of a process of the ASGI server, see movies/api/v1/async_db.py.
+ASYNC_DB_POOL = {
+    'min_size': int(os.environ.get('ASYNC_DB_POOL_MIN_SIZE', 2)),
+    'max_size': int(os.environ.get('ASYNC_DB_POOL_MAX_SIZE', 20)),
+}
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': True,
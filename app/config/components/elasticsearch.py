@@ -0,0 +1,8 @@
+# Elasticsearch index kept up to date by the ETL in postgres_to_es
+
+ELASTICSEARCH = {
+    'HOST': os.environ.get('ES_HOST', 'http://127.0.0.1:9200'),
+    # Alias pointing to the live version of the index
+    'INDEX': 'movies',
+    'TIMEOUT': float(os.environ.get('ES_SEARCH_TIMEOUT_SEC', 5)),
+}
@@ -0,0 +1,119 @@
+"""
+PostgreSQL backend with health checks of persistent connections and an optional connection pool.
+
+Django 3.2 has neither, settings are named after the ones of later Django versions:
+`CONN_HEALTH_CHECKS` pings a persistent connection once per request before reusing it,
+`POOL` ({'min_size': ..., 'max_size': ..., 'timeout': ...}) keeps connections in a pool shared by threads of a process.
+"""
+import threading
+
+import psycopg2.extras
+import psycopg2.pool
+from django.db.backends.postgresql import base
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def is_usable(connection) -> bool:
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if not connection.autocommit:
+            # A connection just opened by the pool is not in autocommit mode yet, and the ping has started
+            # a transaction. Session setup after it fails inside a transaction.
+            connection.rollback()
+    except psycopg2.Error:
+        return False
+    return True
+
+
+class BlockingConnectionPool(psycopg2.pool.ThreadedConnectionPool):
+    """Pool, in which a thread waits up to `timeout` seconds for a free connection when all `maxconn` are taken."""
+
+    def __init__(self, minconn: int, maxconn: int, timeout: float, *args, **kwargs):
+        self.slots = threading.BoundedSemaphore(maxconn)
+        self.timeout = timeout
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def getconn(self, key=None):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise psycopg2.pool.PoolError('No free connection in the pool for {0} seconds'.format(self.timeout))
+        try:
+            return super().getconn(key)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        super().putconn(conn, key, close)
+        self.slots.release()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    health_check_done = False
+
+    @property
+    def pool_options(self):
+        return self.settings_dict.get('POOL')
+
+    def get_pool(self, conn_params: dict) -> BlockingConnectionPool:
+        # Pools are created on first use, so that uwsgi workers don't share connections opened before fork.
+        with _pools_lock:
+            if self.alias not in _pools:
+                _pools[self.alias] = BlockingConnectionPool(
+                    self.pool_options.get('min_size', 1),
+                    self.pool_options.get('max_size', 4),
+                    self.pool_options.get('timeout', 30),
+                    **conn_params,
+                )
+            return _pools[self.alias]
+
+    def get_new_connection(self, conn_params):
+        if not self.pool_options:
+            return super().get_new_connection(conn_params)
+
+        pool = self.get_pool(conn_params)
+        connection = pool.getconn()
+        if connection.closed or (self.settings_dict.get('CONN_HEALTH_CHECKS') and not is_usable(connection)):
+            pool.putconn(connection, close=True)
+            connection = pool.getconn()
+
+        # Same session setup as for a new connection in the base backend.
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        self.isolation_level = connection.isolation_level if isolation_level is None else isolation_level
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+        return connection
+
+    def _close(self):
+        if not self.pool_options or self.connection is None:
+            return super()._close()
+        # The pool rolls back open transactions and drops broken connections.
+        with self.wrap_database_errors:
+            _pools[self.alias].putconn(self.connection, close=bool(self.connection.closed))
+
+    def connect(self):
+        # A new connection needs no check. Set before connecting, as the setup of the connection
+        # calls `ensure_connection`, and a ping then would open a transaction before autocommit is set.
+        self.health_check_done = True
+        super().connect()
+
+    def ensure_connection(self):
+        if (
+            self.connection is not None
+            and self.settings_dict.get('CONN_HEALTH_CHECKS')
+            and not self.health_check_done
+            and not self.in_atomic_block
+        ):
+            # A persistent connection may have been dropped by PG or the network since the last request.
+            if not self.is_usable():
+                self.close()
+            self.health_check_done = True
+        super().ensure_connection()
+
+    def close_if_unusable_or_obsolete(self):
+        # Called at the start and the end of every request.
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
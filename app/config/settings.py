@@ -3,5 +3,7 @@ from split_settings.tools import optional, include
 include(
     'components/common.py',
     'components/database.py',
+    'components/elasticsearch.py',
+    'components/cache.py',
     optional('components/local.py'),
 )
@@ -0,0 +1,11 @@
+"""URLs of the ASGI server: async read path of the movies API, everything else as served by uwsgi."""
+from django.urls import path
+from movies.api.v1 import async_views
+
+from .urls import urlpatterns as wsgi_urlpatterns
+
+urlpatterns = [
+    path('api/v1/movies/', async_views.filmwork_list),
+    path('api/v1/movies/search/', async_views.filmwork_search),
+    path('api/v1/movies/<uuid:pk>/', async_views.filmwork_detail),
+] + wsgi_urlpatterns
@@ -0,0 +1,91 @@
+"""Load test: latency of movies API endpoints under concurrent requests to a running server."""
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+DEFAULT_PATHS = ['/api/v1/movies/', '/api/v1/movies/?page_size=100']
+
+
+def percentile(latencies: List[float], percent: float) -> float:
+    """Nearest-rank percentile of sorted latencies."""
+    index = max(0, min(len(latencies) - 1, round(percent / 100 * len(latencies)) - 1))
+    return latencies[index]
+
+
+def fetch(url: str, timeout: float) -> bool:
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read()
+            return response.status == 200
+    except (urllib.error.URLError, OSError):
+        return False
+
+
+def run(url: str, requests: int, concurrency: int, timeout: float) -> dict:
+    """Send `requests` GETs to `url` from `concurrency` threads. Returns latency stats in milliseconds."""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def request(_):
+        nonlocal errors
+        started = time.perf_counter()
+        ok = fetch(url, timeout)
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.append(elapsed)
+            errors += not ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(request, range(requests)))
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'url': url,
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': errors,
+        'rps': requests / duration,
+        'mean_ms': statistics.mean(latencies),
+        'p50_ms': percentile(latencies, 50),
+        'p90_ms': percentile(latencies, 90),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': latencies[-1],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--base-url', action='append', dest='base_urls',
+        help='server to test, repeat to compare servers, e.g. uwsgi and the ASGI server',
+    )
+    parser.add_argument('--path', action='append', dest='paths', help='endpoint to test, repeatable')
+    parser.add_argument('--requests', type=int, default=500, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=20, help='requests per endpoint before measuring')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--json', action='store_true', help='print results as JSON lines')
+    args = parser.parse_args()
+
+    for path in args.paths or DEFAULT_PATHS:
+        for base_url in args.base_urls or ['http://127.0.0.1:8000']:
+            url = base_url.rstrip('/') + path
+            if args.warmup:
+                run(url, args.warmup, args.concurrency, args.timeout)
+            result = run(url, args.requests, args.concurrency, args.timeout)
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print(
+                    '{url}: {rps:.0f} req/s, p50 {p50_ms:.1f} ms, p90 {p90_ms:.1f} ms, p99 {p99_ms:.1f} ms, '
+                    'max {max_ms:.1f} ms, {errors} errors'.format(**result)
+                )
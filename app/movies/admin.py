@@ -1,8 +1,23 @@
-from django.contrib import admin
+import uuid
+
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.template.response import TemplateResponse
 from django.utils.translation import gettext_lazy as _
+from . import autocomplete, bulk
 from .models import Genre, Filmwork, GenreFilmwork, Person, PersonFilmwork
+from .paginators import EstimatedCountPaginator
 from django.forms import Textarea
-from django.db import models
+from django.db import models, router
+from django.db.models import Exists, OuterRef
+
+
+def is_autocomplete(request):
+    return request.resolver_match is not None and request.resolver_match.url_name == 'autocomplete'
 
 
 @admin.register(Genre)
@@ -10,12 +25,23 @@ class GenreAdmin(admin.ModelAdmin):
     list_display = ('name',)
     search_fields = ('name', 'description')
 
+    def get_search_results(self, request, queryset, search_term):
+        # В автодополнении инлайнов фильма - поиск по началу и похожести названия, по индексу.
+        if is_autocomplete(request):
+            return autocomplete.search(queryset, 'name', search_term), False
+        return super().get_search_results(request, queryset, search_term)
+
 
 @admin.register(Person)
 class PersonAdmin(admin.ModelAdmin):
     list_display = ('full_name',)
     search_fields = ['full_name']
 
+    def get_search_results(self, request, queryset, search_term):
+        if is_autocomplete(request):
+            return autocomplete.search(queryset, 'full_name', search_term), False
+        return super().get_search_results(request, queryset, search_term)
+
 
 class RatingRangeListFilter(admin.SimpleListFilter):
     # Чтобы не было перечисления всех возможных значений рейтинга,
@@ -64,6 +90,27 @@ class RatingRangeListFilter(admin.SimpleListFilter):
                 )
 
 
+class GenreListFilter(admin.SimpleListFilter):
+    # Фильтр по жанру через EXISTS по индексу genre_film_work, без JOIN и DISTINCT по всему списку.
+    title = _('Genre')
+    parameter_name = 'genre'
+
+    def lookups(self, request, model_admin):
+        return Genre.objects.order_by('name').values_list('id', 'name')
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return None
+        try:
+            genre_id = uuid.UUID(self.value())
+        except ValueError as error:
+            # Как у встроенных фильтров: неверное значение в URL - не ошибка сервера.
+            raise IncorrectLookupParameters(error)
+        return queryset.filter(Exists(
+            GenreFilmwork.objects.filter(film_work=OuterRef('pk'), genre_id=genre_id)
+        ))
+
+
 class GenreFilmworkInline(admin.TabularInline):
     model = GenreFilmwork
     autocomplete_fields = ['genre']
@@ -77,6 +124,35 @@ class PersonFilmworkInline(admin.TabularInline):
     }
 
 
+class AttachForm(forms.Form):
+    # Форма действия "Добавить жанр или персону" к выбранным фильмам.
+    genre = forms.ModelChoiceField(
+        Genre.objects.all(),
+        label=_('Genre'),
+        required=False,
+        widget=AutocompleteSelect(GenreFilmwork._meta.get_field('genre'), admin.site),
+    )
+    person = forms.ModelChoiceField(
+        Person.objects.all(),
+        label=_('Person'),
+        required=False,
+        widget=AutocompleteSelect(PersonFilmwork._meta.get_field('person'), admin.site),
+    )
+    role = forms.ChoiceField(
+        label=_('PersonFilwork role'),
+        choices=[('', '---------')] + PersonFilmwork.RoleChoices.choices,
+        required=False,
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('genre') and not cleaned_data.get('person'):
+            raise forms.ValidationError(_('Choose a genre or a person'))
+        if cleaned_data.get('person') and not cleaned_data.get('role'):
+            self.add_error('role', _('Choose a role of the person'))
+        return cleaned_data
+
+
 @admin.register(Filmwork)
 class FilmworkAdmin(admin.ModelAdmin):
     inlines = (
@@ -94,10 +170,91 @@ class FilmworkAdmin(admin.ModelAdmin):
     # Фильтрация в списке
     list_filter = (
         'type',
-        'genrefilmwork__genre__name',
+        GenreListFilter,
         'creation_date',
         RatingRangeListFilter,
     )
 
-    # Поиск по полям
-    search_fields = ('title', 'description', 'id')
+    # Поиск по полям, по триграммным индексам (миграция 0009)
+    search_fields = ('title', 'description')
+
+    # Режим для больших каталогов: без COUNT(*) по всей таблице на каждой странице списка
+    if settings.ADMIN_PERFORMANCE_MODE:
+        show_full_result_count = False
+        paginator = EstimatedCountPaginator
+
+    actions = ['attach_genre_or_person']
+
+    def save_formset(self, request, form, formset, change):
+        # Строки инлайнов сохраняются пачками в транзакции сохранения фильма, а не по одной.
+        # Иначе каждая строка - отдельный запрос, и ETL может перечитывать фильм между ними.
+        formset.save(commit=False)
+        model = formset.model
+        if formset.deleted_objects:
+            model.objects.filter(pk__in=[obj.pk for obj in formset.deleted_objects]).delete()
+
+        # Все строки всех инлайнов получают время изменения самого фильма, сохранённого перед ними.
+        # bulk_create() проставил бы auto_now поля каждой строке заново, поэтому новые строки вставляются
+        # одним INSERT в режиме raw, как при loaddata: значения полей пишутся как есть, без pre_save().
+        now = form.instance.updated_at
+        db = router.db_for_write(model)
+        for obj in formset.new_objects:
+            obj.created_at = obj.updated_at = now
+        if formset.new_objects:
+            model._base_manager.using(db)._insert(
+                formset.new_objects, fields=model._meta.concrete_fields, raw=True, using=db,
+            )
+            for obj in formset.new_objects:
+                obj._state.adding = False
+                obj._state.db = db
+        # bulk_update() не трогает auto_now поля.
+        changed_fields = {'updated_at'}
+        for obj, fields in formset.changed_objects:
+            obj.updated_at = now
+            changed_fields.update(fields)
+        if formset.changed_objects:
+            model.objects.bulk_update(
+                [obj for obj, fields in formset.changed_objects], fields=sorted(changed_fields),
+            )
+        formset.save_m2m()
+
+    @admin.action(description=_('Attach a genre or a person'))
+    def attach_genre_or_person(self, request, queryset):
+        # Одним INSERT ... SELECT для всех выбранных фильмов, в том числе для всех страниц списка.
+        form = AttachForm(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            if form.cleaned_data['genre']:
+                attached = bulk.attach_genre(queryset, form.cleaned_data['genre'])
+            else:
+                attached = bulk.attach_person(queryset, form.cleaned_data['person'], form.cleaned_data['role'])
+            self.message_user(
+                request, _('Filmworks changed: {count}').format(count=attached), messages.SUCCESS,
+            )
+            return None
+
+        return TemplateResponse(request, 'admin/movies/filmwork/attach.html', {
+            **self.admin_site.each_context(request),
+            'title': _('Attach a genre or a person'),
+            'opts': self.model._meta,
+            'form': form,
+            'media': self.media + form.media,
+            'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        })
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по id - точное сравнение по первичному ключу, а не icontains по приведённому к тексту uuid.
+        try:
+            filmwork_id = uuid.UUID(search_term.strip())
+        except ValueError:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk=filmwork_id), False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        match = request.resolver_match
+        if match is not None and match.url_name == 'movies_filmwork_changelist':
+            # В списке не нужны длинные описания.
+            queryset = queryset.only(*self.list_display)
+        return queryset
@@ -0,0 +1,65 @@
+"""
+Async access to PG for the ASGI read path of the movies API.
+
+Django 3.2 ORM is sync only: querysets are still built by the ORM, and their SQL is run over a psycopg 3 async pool.
+"""
+from typing import List, Optional
+
+from django.conf import settings
+from django.db.models import QuerySet
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+_pool = None
+
+
+def get_conninfo() -> str:
+    db_settings = settings.DATABASES['default']
+    return make_conninfo(
+        dbname=db_settings['NAME'],
+        user=db_settings['USER'],
+        password=db_settings['PASSWORD'],
+        host=db_settings['HOST'],
+        port=db_settings['PORT'],
+        # Same encoding, schemas and time zone as Django connections.
+        # Text comes as bytes without an encoding known to Python, e.g. from a SQL_ASCII database.
+        client_encoding='UTF8',
+        options='{0} -c TimeZone=UTC'.format(db_settings['OPTIONS']['options']),
+    )
+
+
+def get_pool() -> AsyncConnectionPool:
+    """One pool per process of the ASGI server, opened in the process' event loop."""
+    global _pool
+    if _pool is None:
+        _pool = AsyncConnectionPool(
+            get_conninfo(),
+            min_size=settings.ASYNC_DB_POOL['min_size'],
+            max_size=settings.ASYNC_DB_POOL['max_size'],
+            kwargs={'autocommit': True, 'row_factory': dict_row},
+        )
+    return _pool
+
+
+async def fetch_all(sql: str, params=None) -> List[dict]:
+    async with get_pool().connection() as connection:
+        cursor = await connection.execute(sql, params)
+        return await cursor.fetchall()
+
+
+async def fetch_value(sql: str, params=None):
+    """First column of the first row, None if there are no rows."""
+    rows = await fetch_all(sql, params)
+    return next(iter(rows[0].values())) if rows else None
+
+
+async def fetch_queryset(queryset: QuerySet) -> List[dict]:
+    """Rows of a `values()` queryset."""
+    sql, params = queryset.query.sql_with_params()
+    return await fetch_all(sql, params)
+
+
+async def fetch_one(queryset: QuerySet) -> Optional[dict]:
+    rows = await fetch_queryset(queryset[:1])
+    return rows[0] if rows else None
@@ -0,0 +1,106 @@
+"""
+Async read path of the movies API for the ASGI server: list, detail and search of filmworks.
+
+DRF views are sync only, so these are plain Django async views with the same URLs, params and output.
+PG and ES are queried without blocking the event loop, so concurrency is bounded by connections, not threads.
+"""
+import uuid
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from movies.paginators import estimated_count
+from rest_framework import status
+from rest_framework.exceptions import APIException, MethodNotAllowed, NotFound
+
+from .async_db import fetch_one, fetch_queryset, fetch_value
+from .cache import async_cached_data
+from .conditional import async_conditional_response
+from .queries import (CATALOGUE_LAST_MODIFIED, FILMWORK_LAST_MODIFIED,
+                      filmwork_values)
+from .search import SEARCH_ERRORS, async_search_filmworks
+from .serializers import FilmworkRowSerializer, FilmworkSearchParamsSerializer
+from .views import FilmworkViewSet, KeysetPagination, SearchUnavailable
+
+
+async def catalogue_last_modified(**kwargs):
+    return await fetch_value(CATALOGUE_LAST_MODIFIED)
+
+
+async def filmwork_last_modified(pk: uuid.UUID):
+    return await fetch_value(FILMWORK_LAST_MODIFIED, [pk])
+
+
+def with_drf_fallback(actions: dict):
+    """
+    Serve requests for the browsable API and for page-number pagination (`?page=N`) with the DRF view.
+
+    These are rare, and run in the sync thread of the ASGI server.
+    """
+    drf_view = sync_to_async(FilmworkViewSet.as_view(actions))
+
+    def decorator(view_func):
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            if 'page' in request.GET or 'text/html' in request.META.get('HTTP_ACCEPT', ''):
+                response = await drf_view(request, *args, **kwargs)
+                return await sync_to_async(response.render)()
+            return await view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def json_view(view_func):
+    """
+    Render data returned by an async view function as JSON, and API exceptions as DRF does.
+
+    The API is read-only, other methods than GET and HEAD are not allowed.
+    """
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            if request.method not in ('GET', 'HEAD'):
+                raise MethodNotAllowed(request.method)
+            data = await view_func(request, *args, **kwargs)
+            response_status = status.HTTP_200_OK
+        except APIException as exc:
+            data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            response_status = exc.status_code
+        return JsonResponse(data, status=response_status, safe=False, json_dumps_params={'ensure_ascii': False})
+    return wrapper
+
+
+@with_drf_fallback({'get': 'list'})
+@async_conditional_response(catalogue_last_modified)
+@json_view
+@async_cached_data
+async def filmwork_list(request):
+    paginator = KeysetPagination()
+    queryset = paginator.get_page_queryset(filmwork_values(), request)
+    page = paginator.set_page(await fetch_queryset(queryset))
+    count = None
+    if paginator.with_count():
+        count = await sync_to_async(estimated_count, thread_sensitive=False)(paginator.model)
+    return paginator.get_paginated_data(FilmworkRowSerializer(page, many=True).data, count)
+
+
+@with_drf_fallback({'get': 'retrieve'})
+@async_conditional_response(filmwork_last_modified)
+@json_view
+@async_cached_data
+async def filmwork_detail(request, pk: uuid.UUID):
+    row = await fetch_one(filmwork_values().filter(pk=pk))
+    if row is None:
+        raise NotFound()
+    return FilmworkRowSerializer(row).data
+
+
+@with_drf_fallback({'get': 'search'})
+@json_view
+async def filmwork_search(request):
+    params = FilmworkSearchParamsSerializer(data={**request.GET.dict(), 'genre': request.GET.getlist('genre')})
+    params.is_valid(raise_exception=True)
+    try:
+        return await async_search_filmworks(params.validated_data)
+    except SEARCH_ERRORS:
+        raise SearchUnavailable()
@@ -0,0 +1,100 @@
+"""
+Cache of movies API responses.
+
+Entries are keyed by the ETag of the resource, computed from the last change in PG, so any change is a cache miss
+whichever process or tool made it. They are also keyed by the catalogue version, bumped by model signals and bulk edits,
+so that entries of a changed catalogue are dropped at once. Entries never read again are evicted as least recently used.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+VERSION_KEY = 'movies_api:version'
+
+
+def get_cache():
+    return caches[settings.MOVIES_API_CACHE['ALIAS']]
+
+
+def get_version() -> str:
+    """
+    Catalogue version: time of the last change as a UNIX timestamp.
+
+    If the version was evicted, it starts anew from the current time, so that old entries are not read again.
+    """
+    return get_cache().get_or_set(VERSION_KEY, '{0:.6f}'.format(time.time()), timeout=None)
+
+
+def bump_version(changed_at: float = None):
+    """Invalidate all cached responses. `changed_at` is a UNIX timestamp of the change, now by default."""
+    changed_at = time.time() if changed_at is None else changed_at
+    # Versions must change even if the change is dated before the current one.
+    version = max(changed_at, float(get_version()) + 1e-6)
+    get_cache().set(VERSION_KEY, '{0:.6f}'.format(version), timeout=None)
+
+
+def get_response_key(request) -> str:
+    """
+    Cache key of a response: the catalogue version, the ETag of the resource and the absolute URI.
+
+    The ETag is set on the request by `conditional_response` from the last change in PG, so a change
+    made anywhere - in another process, by raw SQL or by an import - is a cache miss.
+    """
+    # Absolute URI, as paginated responses contain absolute links.
+    return 'movies_api:{0}:{1}:{2}'.format(
+        get_version(),
+        getattr(request, 'movies_api_etag', ''),
+        hashlib.md5(request.build_absolute_uri().encode()).hexdigest(),
+    )
+
+
+def cached_response(view_method):
+    """
+    Serve GET responses of a view method from the cache.
+
+    Responses other than 200 OK are not cached. Validators are set by `conditional_response`.
+    """
+    @wraps(view_method)
+    def wrapper(view, request, *args, **kwargs):
+        if not settings.MOVIES_API_CACHE['ENABLED']:
+            return view_method(view, request, *args, **kwargs)
+
+        cache = get_cache()
+        key = get_response_key(request)
+        entry = cache.get(key)
+        if entry is None:
+            response = view_method(view, request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            entry = {'data': response.data}
+            cache.set(key, entry, settings.MOVIES_API_CACHE['TIMEOUT'])
+
+        return Response(entry['data'])
+    return wrapper
+
+
+def async_cached_data(view_func):
+    """
+    Serve data of an async view function from the cache, the same entries as of `cached_response`.
+
+    Cache calls run in threads, as cache backends may block on network.
+    """
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        if not settings.MOVIES_API_CACHE['ENABLED']:
+            return await view_func(request, *args, **kwargs)
+
+        cache = get_cache()
+        key = await sync_to_async(get_response_key, thread_sensitive=False)(request)
+        entry = await sync_to_async(cache.get, thread_sensitive=False)(key)
+        if entry is None:
+            entry = {'data': await view_func(request, *args, **kwargs)}
+            await sync_to_async(cache.set, thread_sensitive=False)(key, entry, settings.MOVIES_API_CACHE['TIMEOUT'])
+        return entry['data']
+    return wrapper
@@ -0,0 +1,68 @@
+"""Conditional GETs of the movies API, answered before the view queries and serializes anything."""
+import datetime
+from functools import wraps
+from typing import Tuple
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import status
+
+
+def get_validators(last_modified: datetime.datetime) -> Tuple[str, int]:
+    """
+    ETag and Last-Modified timestamp of a resource changed at `last_modified`.
+
+    ETags are weak, as the same data is rendered differently for different `Accept`.
+    """
+    # HTTP dates have a resolution of a second, ETags keep microseconds.
+    return 'W/"{0:.6f}"'.format(last_modified.timestamp()), int(last_modified.timestamp())
+
+
+def set_validators(response, etag: str, last_modified: int):
+    if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def conditional_response(last_modified_func):
+    """
+    Answer `If-None-Match` and `If-Modified-Since` with 304 Not Modified, set ETag and Last-Modified otherwise.
+
+    `last_modified_func(**view_kwargs)` returns the time of the last change of the resource, None if unknown.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(view, request, *args, **kwargs):
+            last_modified = last_modified_func(**kwargs)
+            if last_modified is None:
+                return view_method(view, request, *args, **kwargs)
+
+            etag, last_modified = get_validators(last_modified)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                # Cached responses are keyed by the ETag, so that a body is never served under a newer one.
+                request.movies_api_etag = etag
+                response = view_method(view, request, *args, **kwargs)
+            return set_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+def async_conditional_response(last_modified_func):
+    """Same as `conditional_response`, for async view functions and an async `last_modified_func`."""
+    def decorator(view_func):
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            last_modified = await last_modified_func(**kwargs)
+            if last_modified is None:
+                return await view_func(request, *args, **kwargs)
+
+            etag, last_modified = get_validators(last_modified)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                request.movies_api_etag = etag
+                response = await view_func(request, *args, **kwargs)
+            return set_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
@@ -0,0 +1,93 @@
+import datetime
+import uuid
+from typing import Optional
+
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import connection
+from django.db.models import OuterRef, QuerySet, Subquery
+from movies.models import Filmwork, GenreFilmwork, PersonFilmwork
+
+FILMWORK_FIELDS = ['id', 'title', 'description', 'creation_date', 'rating', 'type', 'created_at']
+
+
+def _names(through_model, name_field: str, **filters) -> Subquery:
+    """
+    Names of a filmwork's genres or persons as a PG array, aggregated in a correlated subquery.
+
+    One subquery per list avoids multiplying genres by persons in a single GROUP BY.
+    """
+    return Subquery(
+        through_model.objects.filter(film_work=OuterRef('pk'), **filters)
+        .values('film_work')
+        .annotate(names=ArrayAgg(name_field, ordering=name_field))
+        .values('names')
+    )
+
+
+def filmwork_values() -> QuerySet:
+    """
+    Filmworks as dicts with genres and persons by role already aggregated by PG, in a single query.
+
+    Rows are rendered by FilmworkRowSerializer, without building model instances.
+    """
+    return Filmwork.objects.values(
+        *FILMWORK_FIELDS,
+        # Not `genres`, that name is taken by the m2m field.
+        genre_names=_names(GenreFilmwork, 'genre__name'),
+        actors=_names(PersonFilmwork, 'person__full_name', role=PersonFilmwork.RoleChoices.ACTOR),
+        directors=_names(PersonFilmwork, 'person__full_name', role=PersonFilmwork.RoleChoices.DIRECTOR),
+        writers=_names(PersonFilmwork, 'person__full_name', role=PersonFilmwork.RoleChoices.WRITER),
+    )
+
+
+# Every max() is a single step of a backward scan of the (updated_at, id) index.
+CATALOGUE_LAST_MODIFIED = """
+SELECT greatest(
+    (SELECT max(updated_at) FROM content.film_work),
+    (SELECT max(updated_at) FROM content.genre),
+    (SELECT max(updated_at) FROM content.person),
+    (SELECT max(updated_at) FROM content.genre_film_work),
+    (SELECT max(updated_at) FROM content.person_film_work),
+    (SELECT max(updated_at) FROM content.deletion_log)
+)
+"""
+
+FILMWORK_LAST_MODIFIED = """
+SELECT greatest(
+    fw.updated_at,
+    (
+        SELECT max(greatest(gfw.updated_at, g.updated_at))
+        FROM content.genre_film_work gfw
+        JOIN content.genre g ON g.id = gfw.genre_id
+        WHERE gfw.film_work_id = fw.id
+    ),
+    (
+        SELECT max(greatest(pfw.updated_at, p.updated_at))
+        FROM content.person_film_work pfw
+        JOIN content.person p ON p.id = pfw.person_id
+        WHERE pfw.film_work_id = fw.id
+    ),
+    (SELECT max(dl.updated_at) FROM content.deletion_log dl WHERE dl.film_work_id = fw.id)
+)
+FROM content.film_work fw
+WHERE fw.id = %s
+"""
+
+
+def catalogue_last_modified() -> Optional[datetime.datetime]:
+    """Time of the last change of any filmwork, person, genre or their links, deletions included."""
+    with connection.cursor() as cursor:
+        cursor.execute(CATALOGUE_LAST_MODIFIED)
+        return cursor.fetchone()[0]
+
+
+def filmwork_last_modified(filmwork_id) -> Optional[datetime.datetime]:
+    """Time of the last change of a filmwork, its persons and genres, None if there is no such filmwork."""
+    try:
+        filmwork_id = uuid.UUID(str(filmwork_id))
+    except ValueError:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(FILMWORK_LAST_MODIFIED, [str(filmwork_id)])
+        row = cursor.fetchone()
+    return row[0] if row else None
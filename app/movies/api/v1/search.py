@@ -0,0 +1,152 @@
+"""
+Filmwork search in the Elasticsearch index maintained by the ETL.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from elasticsearch import (ApiError, AsyncElasticsearch, Elasticsearch,
+                           TransportError)
+from rest_framework.fields import DateTimeField
+
+# API sort field: ES sort field. Prefix with `-` for descending order.
+SORT_FIELDS = {
+    'rating': 'imdb_rating',
+    'title': 'title.raw',
+    'creation_date': 'creation_date',
+}
+
+SEARCH_FIELDS = ['title^3', 'description', 'director', 'actors_names', 'writers_names']
+
+PERSON_FIELDS = ['director', 'actors_names', 'writers_names']
+
+# Errors of an unavailable search: ES down or too slow (connection errors and timeouts are TransportError),
+# or an error response, e.g. while the index is not created yet by the first ETL run.
+SEARCH_ERRORS = (TransportError, ApiError)
+
+_es_client = None
+_async_es_client = None
+
+
+def get_es_client() -> Elasticsearch:
+    """One client per process, it keeps a pool of connections to ES."""
+    global _es_client
+    if _es_client is None:
+        _es_client = Elasticsearch(
+            hosts=settings.ELASTICSEARCH['HOST'],
+            request_timeout=settings.ELASTICSEARCH['TIMEOUT'],
+        )
+    return _es_client
+
+
+def get_async_es_client() -> AsyncElasticsearch:
+    """One client per process of the ASGI server, it runs in the process' event loop."""
+    global _async_es_client
+    if _async_es_client is None:
+        _async_es_client = AsyncElasticsearch(
+            hosts=settings.ELASTICSEARCH['HOST'],
+            request_timeout=settings.ELASTICSEARCH['TIMEOUT'],
+        )
+    return _async_es_client
+
+
+def encode_cursor(sort_values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(sort_values).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+
+def build_query(params: dict) -> dict:
+    """ES bool query for validated search params."""
+    must = []
+    filters = []
+    if params.get('query'):
+        must.append({'multi_match': {'query': params['query'], 'fields': SEARCH_FIELDS, 'operator': 'and'}})
+    if params.get('genre'):
+        filters.append({'terms': {'genre': params['genre']}})
+    if params.get('person'):
+        filters.append({'multi_match': {'query': params['person'], 'fields': PERSON_FIELDS, 'type': 'phrase'}})
+    if params.get('rating_min') is not None or params.get('rating_max') is not None:
+        rating_range = {}
+        if params.get('rating_min') is not None:
+            rating_range['gte'] = params['rating_min']
+        if params.get('rating_max') is not None:
+            rating_range['lte'] = params['rating_max']
+        filters.append({'range': {'imdb_rating': rating_range}})
+    if not must and not filters:
+        return {'match_all': {}}
+    return {'bool': {'must': must, 'filter': filters}}
+
+
+def build_sort(params: dict) -> list:
+    """
+    Sort by the requested field, by relevance if there is a text query and no sort given.
+
+    Ties are broken by id, so that `search_after` pages through results without gaps or repeats.
+    """
+    sort = params.get('sort')
+    if sort:
+        field = SORT_FIELDS[sort.lstrip('-')]
+        order = 'desc' if sort.startswith('-') else 'asc'
+        sort_by = [{field: {'order': order, 'missing': '_last'}}]
+    elif params.get('query'):
+        sort_by = ['_score']
+    else:
+        sort_by = [{'imdb_rating': {'order': 'desc', 'missing': '_last'}}]
+    return sort_by + [{'id': 'asc'}]
+
+
+def doc_to_representation(doc: dict) -> dict:
+    """ES doc in the same shape as FilmworkSerializer output."""
+    creation_date = doc.get('creation_date')
+    return {
+        'id': doc['id'],
+        'title': doc.get('title'),
+        'description': doc.get('description'),
+        'creation_date': DateTimeField().to_representation(parse_datetime(creation_date)) if creation_date else None,
+        'rating': doc.get('imdb_rating'),
+        'type': doc.get('type'),
+        'genres': doc.get('genre') or [],
+        'actors': doc.get('actors_names') or [],
+        'directors': doc.get('director') or [],
+        'writers': doc.get('writers_names') or [],
+    }
+
+
+def search_body(params: dict) -> dict:
+    """Arguments of the ES search for validated search params."""
+    return {
+        'index': settings.ELASTICSEARCH['INDEX'],
+        'query': build_query(params),
+        'sort': build_sort(params),
+        'size': params['page_size'],
+        'search_after': decode_cursor(params['search_after']) if params.get('search_after') else None,
+        'source_includes': [
+            'id', 'title', 'description', 'creation_date', 'imdb_rating', 'type',
+            'genre', 'actors_names', 'director', 'writers_names',
+        ],
+    }
+
+
+def search_results(response, page_size: int) -> dict:
+    """A page of results and a cursor of the next page, None on the last page."""
+    hits = response['hits']['hits']
+    return {
+        'count': response['hits']['total']['value'],
+        'next': encode_cursor(hits[-1]['sort']) if len(hits) == page_size else None,
+        'results': [doc_to_representation(hit['_source']) for hit in hits],
+    }
+
+
+def search_filmworks(params: dict) -> dict:
+    """Search filmworks in ES with validated params."""
+    return search_results(get_es_client().search(**search_body(params)), params['page_size'])
+
+
+async def async_search_filmworks(params: dict) -> dict:
+    """Same as `search_filmworks`, without blocking the event loop."""
+    response = await get_async_es_client().search(**search_body(params))
+    return search_results(response, params['page_size'])
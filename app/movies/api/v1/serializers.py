@@ -1,6 +1,8 @@
 from movies.models import Filmwork, Genre, GenreFilmwork, PersonFilmwork
 from rest_framework import serializers
 
+from .search import SORT_FIELDS, decode_cursor
+
 
 class GenreSerializer(serializers.ModelSerializer):
     class Meta:
@@ -63,3 +65,53 @@ class FilmworkSerializer(serializers.ModelSerializer):
             'genres',
             'persons_roles',
         ]
+
+
+class FilmworkRowSerializer(serializers.BaseSerializer):
+    """
+    Same output as FilmworkSerializer, rendered from `filmwork_values()` rows.
+
+    Genres and persons by role come already aggregated from PG, so there are no nested serializers to run.
+    """
+    creation_date_field = serializers.DateTimeField()
+
+    def to_representation(self, row):
+        return {
+            'id': str(row['id']),
+            'title': row['title'],
+            'description': row['description'],
+            'creation_date': self.creation_date_field.to_representation(row['creation_date'])
+            if row['creation_date'] else None,
+            'rating': row['rating'],
+            'type': row['type'],
+            'genres': row['genre_names'] or [],
+            'actors': row['actors'] or [],
+            'directors': row['directors'] or [],
+            'writers': row['writers'] or [],
+        }
+
+
+class FilmworkSearchParamsSerializer(serializers.Serializer):
+    """
+    Query params of filmwork search.
+    """
+    query = serializers.CharField(required=False, allow_blank=True)
+    genre = serializers.ListField(child=serializers.CharField(), required=False)
+    person = serializers.CharField(required=False, allow_blank=True)
+    rating_min = serializers.FloatField(required=False)
+    rating_max = serializers.FloatField(required=False)
+    sort = serializers.ChoiceField(
+        choices=[prefix + field for field in SORT_FIELDS for prefix in ('', '-')],
+        required=False,
+    )
+    page_size = serializers.IntegerField(min_value=1, max_value=1000, default=50)
+    search_after = serializers.CharField(required=False)
+
+    def validate_search_after(self, value):
+        try:
+            cursor = decode_cursor(value)
+        except ValueError:
+            cursor = None
+        if not isinstance(cursor, list):
+            raise serializers.ValidationError('Invalid cursor.')
+        return value
@@ -1,11 +1,28 @@
+import base64
+import json
+import uuid
+
+from django.conf import settings
+from django.db import connection
+from django.utils.dateparse import parse_datetime
 from movies.models import Filmwork
-from rest_framework import viewsets
-from rest_framework.pagination import PageNumberPagination
+from movies.paginators import estimated_count
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.permissions import (SAFE_METHODS, BasePermission,
                                         IsAuthenticated)
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
-from .serializers import FilmworkSerializer
+from .cache import cached_response
+from .conditional import conditional_response
+from .queries import (catalogue_last_modified, filmwork_last_modified,
+                      filmwork_values)
+from .search import SEARCH_ERRORS, search_filmworks
+from .serializers import (FilmworkRowSerializer,
+                          FilmworkSearchParamsSerializer, FilmworkSerializer)
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -23,6 +40,108 @@ class StandardResultsSetPagination(PageNumberPagination):
         })
 
 
+class KeysetPagination(BasePagination):
+    """
+    Pagination over the (created_at, id) index, newest first.
+
+    Every page is read from the position in the cursor, so it takes the same time at any depth,
+    unlike OFFSET. Cursors are opaque. Total count is only returned with `?count=true`, and is estimated.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request)))
+
+    def get_page_queryset(self, queryset, request):
+        """Query of the page in the request's cursor, with one extra row telling if there are more."""
+        self.request = request
+        self.model = queryset.model
+        self.limit = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        backwards = cursor is not None and cursor['backwards']
+        self.cursor_given = cursor is not None
+        self.backwards = backwards
+
+        if cursor is not None:
+            # Row comparison lets PG start the index scan right at the cursor.
+            queryset = queryset.extra(
+                where=['(created_at, id) {0} (%s, %s)'.format('>' if backwards else '<')],
+                params=[
+                    self.model._meta.get_field('created_at').get_db_prep_value(cursor['created_at'], connection),
+                    self.model._meta.pk.get_db_prep_value(cursor['id'], connection),
+                ],
+            )
+        ordering = ('created_at', 'id') if backwards else ('-created_at', '-id')
+        return queryset.order_by(*ordering)[:self.limit + 1]
+
+    def set_page(self, rows):
+        """Page out of the rows of `get_page_queryset()`."""
+        has_more = len(rows) > self.limit
+        page = rows[:self.limit]
+        if self.backwards:
+            page.reverse()
+
+        self.has_next = True if self.backwards else has_more
+        self.has_previous = has_more if self.backwards else self.cursor_given
+        self.page = page
+        return page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.GET.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.GET.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            created_at, filmwork_id, backwards = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            created_at = parse_datetime(created_at)
+            if created_at is None:
+                raise ValueError()
+            filmwork_id = uuid.UUID(filmwork_id)
+        except (TypeError, ValueError, AttributeError):
+            raise NotFound(self.invalid_cursor_message)
+        return {'created_at': created_at, 'id': filmwork_id, 'backwards': bool(backwards)}
+
+    def encode_cursor(self, filmwork, backwards):
+        if isinstance(filmwork, dict):
+            created_at, filmwork_id = filmwork['created_at'], filmwork['id']
+        else:
+            created_at, filmwork_id = filmwork.created_at, filmwork.id
+        position = [created_at.isoformat(), str(filmwork_id), backwards]
+        encoded = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def with_count(self) -> bool:
+        return self.request.GET.get('count', '').lower() in ('1', 'true')
+
+    def get_paginated_data(self, data, count=None) -> dict:
+        return {
+            'count': count,
+            'next': self.encode_cursor(self.page[-1], backwards=False) if self.has_next and self.page else None,
+            'prev': self.encode_cursor(self.page[0], backwards=True) if self.has_previous and self.page else None,
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data, estimated_count(self.model) if self.with_count() else None))
+
+
+class SearchUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Search is temporarily unavailable, try again later.'
+    default_code = 'search_unavailable'
+
+
 class ReadOnly(BasePermission):
     def has_permission(self, request, view):
         return request.method in SAFE_METHODS
@@ -35,7 +154,56 @@ class FilmworkViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Filmwork.objects.prefetch_related(
         'genres',
         'personfilmwork_set__person'
-    )
+    ).order_by('-created_at', '-id')
     serializer_class = FilmworkSerializer
     permission_classes = [IsAuthenticated | ReadOnly]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        if settings.MOVIES_API_AGGREGATE_IN_PG:
+            return filmwork_values().order_by('-created_at', '-id')
+        return super().get_queryset()
+
+    def get_serializer_class(self):
+        if settings.MOVIES_API_AGGREGATE_IN_PG:
+            return FilmworkRowSerializer
+        return super().get_serializer_class()
+
+    @conditional_response(lambda **kwargs: catalogue_last_modified())
+    @cached_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_response(lambda pk: filmwork_last_modified(pk))
+    @cached_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @property
+    def paginator(self):
+        """Clients asking for a `page` number still get page-number pagination with exact counts."""
+        if not hasattr(self, '_paginator'):
+            if 'page' in self.request.query_params:
+                self._paginator = StandardResultsSetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    @action(detail=False)
+    def search(self, request):
+        """
+        Full-text search and filtering of filmworks in Elasticsearch, without touching PG.
+
+        Params: query, genre (repeatable), person, rating_min, rating_max,
+        sort (rating, title, creation_date, `-` for descending), page_size.
+        Pass `next` of a response as `search_after` to get the next page.
+        """
+        params = FilmworkSearchParamsSerializer(data={
+            **request.query_params.dict(),
+            'genre': request.query_params.getlist('genre'),
+        })
+        params.is_valid(raise_exception=True)
+        try:
+            return Response(search_filmworks(params.validated_data))
+        except SEARCH_ERRORS:
+            raise SearchUnavailable()
@@ -7,5 +7,5 @@ class MoviesConfig(AppConfig):
     name = 'movies'
     verbose_name = _('movies')
 
-    # def ready(self):
-    #     import movies.signals
+    def ready(self):
+        import movies.signals  # noqa: F401
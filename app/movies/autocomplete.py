@@ -0,0 +1,84 @@
+"""
+Autocomplete of persons and genres in filmwork inlines of the admin.
+
+Names starting with the term come first, then names similar to it by trigrams, both over the trigram GIN
+index on UPPER(name). Results are limited, and the latest terms are kept in an in-process LRU cache.
+Entries are keyed by the time of the last change of the model, so names added or renamed in any process
+are found at once. Deleted names may be offered until the entry expires.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, List, Optional
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db.models import Max, Model, QuerySet
+from django.db.models.functions import Upper
+
+
+class LRUCache:
+    """Thread-safe LRU cache of up to `maxsize` entries, each valid for `ttl` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[list]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: list):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+cache = LRUCache(
+    maxsize=settings.ADMIN_AUTOCOMPLETE['CACHE_SIZE'],
+    ttl=settings.ADMIN_AUTOCOMPLETE['CACHE_TTL'],
+)
+
+
+def search(queryset: QuerySet, field: str, term: str) -> List[Model]:
+    """Up to ADMIN_AUTOCOMPLETE['LIMIT'] objects of the queryset with `field` matching the term."""
+    limit = settings.ADMIN_AUTOCOMPLETE['LIMIT']
+    term = ' '.join(term.split()).upper()
+    # Max over the (updated_at, id) index, a lookup of one index entry.
+    last_changed = queryset.model.objects.aggregate(last_changed=Max('updated_at'))['last_changed']
+    key = (queryset.model._meta.label, field, term, last_changed)
+    results = cache.get(key)
+    if results is not None:
+        return results
+
+    if not term:
+        results = list(queryset.order_by(field)[:limit])
+    else:
+        queryset = queryset.annotate(upper_name=Upper(field))
+        results = list(queryset.filter(upper_name__startswith=term).order_by(field)[:limit])
+        if len(results) < limit:
+            # `%` operator over the index, then ranked by similarity.
+            results += list(
+                queryset.filter(upper_name__trigram_similar=term)
+                .exclude(pk__in=[obj.pk for obj in results])
+                .annotate(similarity=TrigramSimilarity('upper_name', term))
+                .order_by('-similarity', field)[:limit - len(results)]
+            )
+    cache.set(key, results)
+    return results
@@ -0,0 +1,44 @@
+"""Bulk edits of the catalogue from the admin, each in a single statement."""
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from movies.api.v1.cache import bump_version
+from movies.models import Genre, Person
+
+# Links already in place are skipped: genres by the unique constraint, persons by their role.
+ATTACH_GENRE = """
+INSERT INTO content.genre_film_work (id, film_work_id, genre_id, created_at, updated_at)
+SELECT gen_random_uuid(), fw.id, %s, now(), now()
+FROM ({filmworks}) fw
+ON CONFLICT (film_work_id, genre_id) DO NOTHING
+"""
+
+ATTACH_PERSON = """
+INSERT INTO content.person_film_work (id, film_work_id, person_id, role, created_at, updated_at)
+SELECT gen_random_uuid(), fw.id, %s, %s, now(), now()
+FROM ({filmworks}) fw
+WHERE NOT EXISTS (
+    SELECT 1 FROM content.person_film_work pfw
+    WHERE pfw.film_work_id = fw.id AND pfw.person_id = %s AND pfw.role = %s
+)
+"""
+
+
+def _attach(sql: str, filmworks: QuerySet, params: list, params_after: tuple = ()) -> int:
+    """Run an INSERT ... SELECT over the filmworks. `params` go before the filmworks query, `params_after` after it."""
+    filmworks_sql, filmworks_params = filmworks.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql.format(filmworks=filmworks_sql), [*params, *filmworks_params, *params_after])
+        attached = cursor.rowcount
+    # Model signals are not sent for these rows.
+    transaction.on_commit(bump_version)
+    return attached
+
+
+def attach_genre(filmworks: QuerySet, genre: Genre) -> int:
+    """Add the genre to the filmworks that don't have it yet. Returns the number of filmworks changed."""
+    return _attach(ATTACH_GENRE, filmworks, [genre.pk])
+
+
+def attach_person(filmworks: QuerySet, person: Person, role: str) -> int:
+    """Add the person in the role to the filmworks that don't have them yet. Returns the number of filmworks changed."""
+    return _attach(ATTACH_PERSON, filmworks, [person.pk, role], (person.pk, role))
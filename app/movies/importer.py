@@ -0,0 +1,309 @@
+"""
+Bulk import of filmworks into the content schema with COPY.
+
+Sources are read as a stream of filmwork records:
+{'id', 'title', 'description', 'creation_date', 'rating', 'type', 'genres': [name], 'persons': [(full_name, role)]}.
+Genres and persons are deduplicated by name against the DB. Every batch is loaded in one transaction:
+rows are copied into temp tables and inserted from there, skipping filmworks that are already in the DB,
+so that a batch loaded again after a crash changes nothing.
+"""
+import csv
+import datetime
+import io
+import itertools
+import json
+import sqlite3
+import time
+import uuid
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.db import connection, transaction
+from django.utils import timezone
+from movies import autocomplete
+from movies.api.v1.cache import bump_version
+
+# Filmworks without ids in the source get ids derived from their title and creation date,
+# so that they are not duplicated when imported again.
+FILMWORK_ID_NAMESPACE = uuid.UUID('5c1d5ae5-6a7e-4d62-9a4f-3f0e5f3a9c12')
+
+# List columns of CSV sources, names are separated by `;`.
+CSV_PERSON_COLUMNS = {'actors': 'actor', 'directors': 'director', 'writers': 'writer'}
+
+TABLE_COLUMNS = {
+    'genre': ('id', 'name', 'created_at', 'updated_at'),
+    'person': ('id', 'full_name', 'created_at', 'updated_at'),
+    'film_work': ('id', 'title', 'description', 'creation_date', 'rating', 'type', 'created_at', 'updated_at'),
+    'genre_film_work': ('id', 'film_work_id', 'genre_id', 'created_at', 'updated_at'),
+    'person_film_work': ('id', 'film_work_id', 'person_id', 'role', 'created_at', 'updated_at'),
+}
+
+SELECT_SQLITE_FILMWORKS = """
+SELECT id, title, description, creation_date, rating, type FROM film_work ORDER BY id
+"""
+
+SELECT_SQLITE_GENRES = """
+SELECT gfw.film_work_id, g.name
+FROM genre_film_work gfw JOIN genre g ON g.id = gfw.genre_id
+WHERE gfw.film_work_id IN ({placeholders})
+"""
+
+SELECT_SQLITE_PERSONS = """
+SELECT pfw.film_work_id, p.full_name, pfw.role
+FROM person_film_work pfw JOIN person p ON p.id = pfw.person_id
+WHERE pfw.film_work_id IN ({placeholders})
+"""
+
+# The oldest row of every name, as names are not unique in the DB. Served by the (name, created_at) btree indexes.
+SELECT_IDS_BY_NAMES = """
+SELECT DISTINCT ON ({name_column}) {name_column}, id
+FROM content.{table}
+WHERE {name_column} = ANY(%s)
+ORDER BY {name_column}, created_at
+"""
+
+# Max number of ids in a single SQLite query, below SQLITE_MAX_VARIABLE_NUMBER of older SQLite versions.
+SQLITE_BATCH_SIZE = 500
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def read_sqlite(path: str) -> Iterator[dict]:
+    """Filmworks of an SQLite database in the schema the content schema was imported from."""
+    sqlite_connection = sqlite3.connect(path)
+    sqlite_connection.row_factory = sqlite3.Row
+    try:
+        filmworks = sqlite_connection.execute(SELECT_SQLITE_FILMWORKS)
+        while True:
+            rows = filmworks.fetchmany(SQLITE_BATCH_SIZE)
+            if not rows:
+                return
+            records = {row['id']: {**dict(row), 'genres': [], 'persons': []} for row in rows}
+            placeholders = ', '.join('?' * len(records))
+            links = sqlite_connection.cursor()
+            for film_work_id, name in links.execute(
+                SELECT_SQLITE_GENRES.format(placeholders=placeholders), list(records),
+            ):
+                records[film_work_id]['genres'].append(name)
+            for film_work_id, full_name, role in links.execute(
+                SELECT_SQLITE_PERSONS.format(placeholders=placeholders), list(records),
+            ):
+                records[film_work_id]['persons'].append((full_name, role))
+            yield from records.values()
+    finally:
+        sqlite_connection.close()
+
+
+def read_csv(path: str) -> Iterator[dict]:
+    """
+    Filmworks of a CSV file with a header.
+
+    Columns: id (optional), title, description, creation_date, rating, type,
+    genres, actors, directors, writers - names separated by `;`.
+    """
+    def names(value: Optional[str]) -> List[str]:
+        return [name.strip() for name in (value or '').split(';') if name.strip()]
+
+    with open(path, newline='', encoding='utf-8') as source:
+        for row in csv.DictReader(source):
+            yield {
+                'id': row.get('id') or None,
+                'title': row['title'],
+                'description': row.get('description') or None,
+                'creation_date': row.get('creation_date') or None,
+                'rating': row.get('rating') or None,
+                'type': row.get('type') or None,
+                'genres': names(row.get('genres')),
+                'persons': [
+                    (full_name, role)
+                    for column, role in CSV_PERSON_COLUMNS.items()
+                    for full_name in names(row.get(column))
+                ],
+            }
+
+
+def read_jsonl(path: str) -> Iterator[dict]:
+    """Filmworks of a JSON Lines file, persons as {"full_name": ..., "role": ...}."""
+    with open(path, encoding='utf-8') as source:
+        for line in source:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield {
+                **record,
+                'genres': record.get('genres') or [],
+                'persons': [(person['full_name'], person['role']) for person in record.get('persons') or []],
+            }
+
+
+READERS = {
+    'sqlite': read_sqlite,
+    'csv': read_csv,
+    'jsonl': read_jsonl,
+}
+
+
+def filmwork_id(record: dict) -> str:
+    if record.get('id'):
+        return str(uuid.UUID(str(record['id'])))
+    return str(uuid.uuid5(FILMWORK_ID_NAMESPACE, '{0}|{1}'.format(record['title'], record.get('creation_date') or '')))
+
+
+def to_copy_value(value) -> str:
+    """Value in the text format of COPY."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_rows(cursor, table: str, rows: List[tuple]):
+    """COPY rows into the temp table of `table`."""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(to_copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor.copy_expert(
+        'COPY import_{0} ({1}) FROM STDIN'.format(table, ', '.join(TABLE_COLUMNS[table])), buffer,
+    )
+
+
+class CatalogueImporter:
+    """Loads batches of filmwork records, keeping ids of the genres and persons it has seen by name."""
+
+    def __init__(self):
+        self.genre_ids: Dict[str, str] = {}
+        self.person_ids: Dict[str, str] = {}
+
+    def create_temp_tables(self, cursor):
+        # Tables live as long as the connection, and are emptied on every commit.
+        for table in TABLE_COLUMNS:
+            cursor.execute(
+                'CREATE TEMP TABLE IF NOT EXISTS import_{0} (LIKE content.{0} INCLUDING DEFAULTS) '
+                'ON COMMIT DELETE ROWS'.format(table)
+            )
+
+    def resolve_names(self, cursor, table: str, name_column: str, names: Iterable[str], ids: Dict[str, str], now):
+        """Fill `ids` with ids of names in the DB, and new ids for names not in it. Returns rows of new names."""
+        unknown = sorted({name for name in names if name not in ids})
+        if not unknown:
+            return []
+        cursor.execute(SELECT_IDS_BY_NAMES.format(name_column=name_column, table=table), [unknown])
+        ids.update((name, str(row_id)) for name, row_id in cursor.fetchall())
+        new_rows = []
+        for name in unknown:
+            if name not in ids:
+                ids[name] = str(uuid.uuid4())
+                new_rows.append((ids[name], name, now, now))
+        return new_rows
+
+    def load_batch(self, records: List[dict]) -> int:
+        """Load a batch of records in one transaction. Returns the number of rows inserted."""
+        now = timezone.now()
+        filmworks = {}
+        for record in records:
+            filmworks[filmwork_id(record)] = record
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            self.create_temp_tables(cursor)
+
+            # Names are resolved in the transaction, new ones are rolled back with it on failure.
+            genre_ids, person_ids = dict(self.genre_ids), dict(self.person_ids)
+            new_genres = self.resolve_names(
+                cursor, 'genre', 'name',
+                (name for record in filmworks.values() for name in record['genres']), genre_ids, now,
+            )
+            new_persons = self.resolve_names(
+                cursor, 'person', 'full_name',
+                (full_name for record in filmworks.values() for full_name, _role in record['persons']), person_ids, now,
+            )
+            copy_rows(cursor, 'genre', new_genres)
+            copy_rows(cursor, 'person', new_persons)
+            copy_rows(cursor, 'film_work', [
+                (
+                    # Dates are passed as they are, PG parses both dates and timestamps.
+                    film_work_id, record['title'], record.get('description'), record.get('creation_date'),
+                    record.get('rating'), record.get('type'), now, now,
+                )
+                for film_work_id, record in filmworks.items()
+            ])
+            cursor.execute('INSERT INTO content.genre SELECT * FROM import_genre')
+            cursor.execute('INSERT INTO content.person SELECT * FROM import_person')
+            inserted = len(new_genres) + len(new_persons)
+
+            cursor.execute(
+                'INSERT INTO content.film_work SELECT * FROM import_film_work ON CONFLICT (id) DO NOTHING RETURNING id'
+            )
+            new_filmwork_ids = {str(row[0]) for row in cursor.fetchall()}
+            inserted += len(new_filmwork_ids)
+
+            # Links only of new filmworks: filmworks in the DB already have theirs.
+            genre_links = {
+                (film_work_id, genre_ids[name])
+                for film_work_id in new_filmwork_ids for name in filmworks[film_work_id]['genres']
+            }
+            person_links = {
+                (film_work_id, person_ids[full_name], role)
+                for film_work_id in new_filmwork_ids for full_name, role in filmworks[film_work_id]['persons']
+            }
+            copy_rows(cursor, 'genre_film_work', [(str(uuid.uuid4()), *link, now, now) for link in genre_links])
+            copy_rows(cursor, 'person_film_work', [(str(uuid.uuid4()), *link, now, now) for link in person_links])
+            cursor.execute('INSERT INTO content.genre_film_work SELECT * FROM import_genre_film_work')
+            cursor.execute('INSERT INTO content.person_film_work SELECT * FROM import_person_film_work')
+            inserted += len(genre_links) + len(person_links)
+            transaction.on_commit(bump_version)
+            transaction.on_commit(autocomplete.cache.clear)
+
+        self.genre_ids, self.person_ids = genre_ids, person_ids
+        return inserted
+
+
+class Progress:
+    """Number of source records loaded, kept in a JSON file, to resume an import from it."""
+
+    def __init__(self, path: str, source: str):
+        self.path = path
+        self.source = source
+
+    def load(self) -> int:
+        try:
+            with open(self.path) as progress_file:
+                progress = json.load(progress_file)
+        except FileNotFoundError:
+            return 0
+        return progress['records'] if progress.get('source') == self.source else 0
+
+    def save(self, records: int):
+        with open(self.path, 'w') as progress_file:
+            json.dump({'source': self.source, 'records': records}, progress_file)
+
+
+def import_catalogue(
+    records: Iterable[dict],
+    batch_size: int,
+    progress: Progress,
+    resume: bool = True,
+) -> Iterator[Tuple[int, int, float]]:
+    """
+    Load records in batches. Yields totals of records and inserted rows, and seconds spent, after every batch.
+
+    Records loaded by a previous run are skipped if `resume`.
+    """
+    importer = CatalogueImporter()
+    done = progress.load() if resume else 0
+    records = itertools.islice(records, done, None)
+    inserted = 0
+    started = time.monotonic()
+    for batch in batched(records, batch_size):
+        inserted += importer.load_batch(batch)
+        done += len(batch)
+        progress.save(done)
+        yield done, inserted, time.monotonic() - started
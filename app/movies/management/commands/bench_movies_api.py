@@ -0,0 +1,67 @@
+"""Benchmark: movies API serialization with nested serializers vs lists aggregated in PG."""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from movies.api.v1.queries import filmwork_values
+from movies.api.v1.serializers import FilmworkRowSerializer, FilmworkSerializer
+from movies.api.v1.views import FilmworkViewSet
+
+LIST_FIELDS = ('genres', 'actors', 'directors', 'writers')
+
+
+def serialize_models(page_size, page):
+    queryset = FilmworkViewSet.queryset[page * page_size:(page + 1) * page_size]
+    return FilmworkSerializer(queryset, many=True).data
+
+
+def serialize_rows(page_size, page):
+    queryset = filmwork_values().order_by('-created_at', '-id')[page * page_size:(page + 1) * page_size]
+    return FilmworkRowSerializer(queryset, many=True).data
+
+
+def normalized(representation):
+    """Nested serializers don't order genres and persons, compare them as sorted lists."""
+    return {
+        key: sorted(value) if key in LIST_FIELDS else value
+        for key, value in representation.items()
+    }
+
+
+def bench(serialize, page_size, pages, repeat):
+    """Best filmworks per second out of `repeat` runs, and queries per page."""
+    best = float('inf')
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for page in range(pages):
+                serialize(page_size, page)
+            best = min(best, time.perf_counter() - started)
+    return page_size * pages / best, len(queries) / pages
+
+
+class Command(BaseCommand):
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--pages', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        page_size, pages, repeat = options['page_size'], options['pages'], options['repeat']
+
+        for page in range(pages):
+            expected = [normalized(item) for item in serialize_models(page_size, page)]
+            actual = [normalized(item) for item in serialize_rows(page_size, page)]
+            if expected != actual:
+                raise CommandError('Outputs differ on page {0}'.format(page))
+
+        models_rate, models_queries = bench(serialize_models, page_size, pages, repeat)
+        rows_rate, rows_queries = bench(serialize_rows, page_size, pages, repeat)
+        self.stdout.write('FilmworkSerializer:    {0:>8.0f} filmworks/s, {1:.0f} queries/page'.format(
+            models_rate, models_queries))
+        self.stdout.write('FilmworkRowSerializer: {0:>8.0f} filmworks/s, {1:.0f} queries/page'.format(
+            rows_rate, rows_queries))
+        self.stdout.write('speedup:               {0:>8.1f}x'.format(rows_rate / models_rate))
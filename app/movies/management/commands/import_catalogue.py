@@ -0,0 +1,46 @@
+"""Import filmworks with their genres and persons from an SQLite, CSV or JSONL file with COPY, in resumable batches."""
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from movies.importer import READERS, Progress, import_catalogue
+
+EXTENSIONS = {
+    '.sqlite': 'sqlite',
+    '.db': 'sqlite',
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+}
+
+
+class Command(BaseCommand):
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument('source')
+        parser.add_argument('--format', choices=sorted(READERS), help='By the source extension if not given.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--progress-file', help='<source>.progress.json if not given.')
+        parser.add_argument(
+            '--restart', action='store_true', help='Start from the first record, not where the last run stopped.',
+        )
+
+    def handle(self, *args, **options):
+        source = options['source']
+        source_format = options['format'] or EXTENSIONS.get(os.path.splitext(source)[1].lower())
+        if source_format is None:
+            raise CommandError('Unknown format of {0}, pass --format'.format(source))
+        if not os.path.exists(source):
+            raise CommandError('{0} does not exist'.format(source))
+        progress = Progress(options['progress_file'] or '{0}.progress.json'.format(source), os.path.abspath(source))
+
+        records = inserted = 0
+        seconds = 0.0
+        for records, inserted, seconds in import_catalogue(
+            READERS[source_format](source), options['batch_size'], progress, resume=not options['restart'],
+        ):
+            self.stdout.write('{0} records, {1} rows inserted, {2:.0f} rows/s'.format(
+                records, inserted, inserted / seconds if seconds else 0,
+            ))
+        self.stdout.write(self.style.SUCCESS('Done: {0} records, {1} rows inserted in {2:.1f}s, {3:.0f} rows/s'.format(
+            records, inserted, seconds, inserted / seconds if seconds else 0,
+        )))
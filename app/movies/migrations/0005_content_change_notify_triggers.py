@@ -0,0 +1,52 @@
+# Generated by Django 3.2 on 2026-10-18 10:30
+
+from django.db import migrations
+
+CONTENT_TABLES = ('film_work', 'person', 'genre', 'person_film_work', 'genre_film_work')
+
+# Notifies ETL about every changed row with payload `table:id`.
+# m2m tables send the id of the filmwork, other tables send their own id.
+# Identical payloads in one transaction are delivered once.
+CREATE_NOTIFY_FUNCTION = """
+CREATE OR REPLACE FUNCTION content.notify_content_change() RETURNS trigger AS $$
+DECLARE
+    id_column text := CASE
+        WHEN TG_TABLE_NAME IN ('person_film_work', 'genre_film_work') THEN 'film_work_id'
+        ELSE 'id'
+    END;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM pg_notify('content_changes', TG_TABLE_NAME || ':' || (to_jsonb(OLD) ->> id_column));
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM pg_notify('content_changes', TG_TABLE_NAME || ':' || (to_jsonb(NEW) ->> id_column));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+CREATE_TRIGGER = """
+CREATE TRIGGER notify_content_change
+    AFTER INSERT OR UPDATE OR DELETE ON content.{0}
+    FOR EACH ROW EXECUTE FUNCTION content.notify_content_change();
+"""
+
+DROP_TRIGGER = 'DROP TRIGGER IF EXISTS notify_content_change ON content.{0};'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_updated_at_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            CREATE_NOTIFY_FUNCTION,
+            reverse_sql='DROP FUNCTION IF EXISTS content.notify_content_change();',
+        ),
+    ] + [
+        migrations.RunSQL(CREATE_TRIGGER.format(table), reverse_sql=DROP_TRIGGER.format(table))
+        for table in CONTENT_TABLES
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 3.2 on 2026-10-18 11:00
+
+from django.db import migrations
+
+# Filmworks to re-check by ETL after rows were deleted: deleted filmworks are removed from ES,
+# filmworks that lost a person or a genre are re-rendered.
+# Columns are named like in content tables, so that ETL pages through the log the same way.
+CREATE_DELETION_LOG = """
+CREATE TABLE IF NOT EXISTS content.deletion_log (
+    id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    film_work_id uuid NOT NULL,
+    updated_at timestamp with time zone NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS deletion_log_updated_at_id_idx ON content.deletion_log (updated_at, id);
+"""
+
+CREATE_LOG_FUNCTION = """
+CREATE OR REPLACE FUNCTION content.log_filmwork_deletion() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'film_work' THEN
+        INSERT INTO content.deletion_log (film_work_id) VALUES (OLD.id);
+    ELSE
+        INSERT INTO content.deletion_log (film_work_id) VALUES (OLD.film_work_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+CREATE_DELETE_TRIGGER = """
+CREATE TRIGGER log_filmwork_deletion
+    AFTER DELETE ON content.{0}
+    FOR EACH ROW EXECUTE FUNCTION content.log_filmwork_deletion();
+"""
+
+# A person or a genre moved to another filmwork is gone from the old one.
+CREATE_MOVE_TRIGGER = """
+CREATE TRIGGER log_filmwork_move
+    AFTER UPDATE OF film_work_id ON content.{0}
+    FOR EACH ROW
+    WHEN (OLD.film_work_id IS DISTINCT FROM NEW.film_work_id)
+    EXECUTE FUNCTION content.log_filmwork_deletion();
+"""
+
+DROP_DELETE_TRIGGER = 'DROP TRIGGER IF EXISTS log_filmwork_deletion ON content.{0};'
+
+DROP_MOVE_TRIGGER = 'DROP TRIGGER IF EXISTS log_filmwork_move ON content.{0};'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0005_content_change_notify_triggers'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_DELETION_LOG, reverse_sql='DROP TABLE IF EXISTS content.deletion_log;'),
+        migrations.RunSQL(
+            CREATE_LOG_FUNCTION,
+            reverse_sql='DROP FUNCTION IF EXISTS content.log_filmwork_deletion();',
+        ),
+    ] + [
+        migrations.RunSQL(CREATE_DELETE_TRIGGER.format(table), reverse_sql=DROP_DELETE_TRIGGER.format(table))
+        for table in ('film_work', 'person_film_work', 'genre_film_work')
+    ] + [
+        migrations.RunSQL(CREATE_MOVE_TRIGGER.format(table), reverse_sql=DROP_MOVE_TRIGGER.format(table))
+        for table in ('person_film_work', 'genre_film_work')
+    ]
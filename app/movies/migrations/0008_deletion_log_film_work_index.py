@@ -0,0 +1,19 @@
+# Generated by Django 3.2 on 2026-10-18 13:00
+
+from django.db import migrations
+
+# Last change of a filmwork for conditional GETs of the API includes persons and genres it lost.
+CREATE_INDEX = """
+CREATE INDEX IF NOT EXISTS deletion_log_film_work_updated_at_idx ON content.deletion_log (film_work_id, updated_at);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0007_film_work_created_at_id_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_INDEX, reverse_sql='DROP INDEX IF EXISTS content.deletion_log_film_work_updated_at_idx;'),
+    ]
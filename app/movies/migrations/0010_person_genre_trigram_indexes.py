@@ -0,0 +1,33 @@
+# Generated by Django 3.2 on 2026-10-18 15:00
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0009_film_work_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='genre',
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper('name'), name='gin_trgm_ops',
+                ),
+                name='genre_name_trgm_idx',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper('full_name'), name='gin_trgm_ops',
+                ),
+                name='person_full_name_trgm_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+# The constraint was declared on the model, but no migration created it. Links repeated since then are removed first,
+# the oldest one of every filmwork and genre is kept.
+DELETE_DUPLICATE_GENRE_LINKS = """
+DELETE FROM content.genre_film_work gfw
+USING content.genre_film_work kept
+WHERE gfw.film_work_id = kept.film_work_id
+    AND gfw.genre_id = kept.genre_id
+    AND (gfw.created_at, gfw.id) > (kept.created_at, kept.id);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0010_person_genre_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(DELETE_DUPLICATE_GENRE_LINKS, reverse_sql=migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='genrefilmwork',
+            constraint=models.UniqueConstraint(fields=('film_work_id', 'genre_id'), name='unique genre for filmwork'),
+        ),
+    ]
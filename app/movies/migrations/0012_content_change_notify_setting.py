@@ -0,0 +1,42 @@
+# Generated by Django 3.2 on 2026-10-18 17:00
+
+from importlib import import_module
+
+from django.db import migrations
+
+notify_triggers = import_module('movies.migrations.0005_content_change_notify_triggers')
+
+# Triggers send notifications only in sessions with `content.notify = on`, set for the database
+# when ETL runs with ETL_NOTIFY=True. Otherwise a changed row costs one call of the function and no NOTIFY.
+CREATE_NOTIFY_FUNCTION = """
+CREATE OR REPLACE FUNCTION content.notify_content_change() RETURNS trigger AS $$
+DECLARE
+    id_column text := CASE
+        WHEN TG_TABLE_NAME IN ('person_film_work', 'genre_film_work') THEN 'film_work_id'
+        ELSE 'id'
+    END;
+BEGIN
+    IF coalesce(current_setting('content.notify', true), '') <> 'on' THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM pg_notify('content_changes', TG_TABLE_NAME || ':' || (to_jsonb(OLD) ->> id_column));
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM pg_notify('content_changes', TG_TABLE_NAME || ':' || (to_jsonb(NEW) ->> id_column));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0011_genre_film_work_unique'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_NOTIFY_FUNCTION, reverse_sql=notify_triggers.CREATE_NOTIFY_FUNCTION),
+    ]
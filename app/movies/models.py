@@ -1,7 +1,9 @@
 import uuid
 
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models.functions import Upper
 from django.utils.translation import gettext_lazy as _
 
 
@@ -34,6 +36,13 @@ class Genre(UUIDMixin, CreatedAtMixin, UpdatedAtMixin):
         db_table = 'content"."genre'
         verbose_name = _('Genre')
         verbose_name_plural = _('Genres')
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='genre_updated_at_id_idx'),
+            # Admin search and autocomplete.
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='genre_name_trgm_idx'),
+            # Exact lookup of names by the catalogue import, in the order of its DISTINCT ON.
+            models.Index(fields=['name', 'created_at'], name='genre_name_created_at_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -46,6 +55,13 @@ class Person(UUIDMixin, CreatedAtMixin, UpdatedAtMixin):
         db_table = 'content"."person'
         verbose_name = _('Person')
         verbose_name_plural = _('Persons')
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='person_updated_at_id_idx'),
+            # Admin search and autocomplete.
+            GinIndex(OpClass(Upper('full_name'), name='gin_trgm_ops'), name='person_full_name_trgm_idx'),
+            # Exact lookup of names by the catalogue import, in the order of its DISTINCT ON.
+            models.Index(fields=['full_name', 'created_at'], name='person_name_created_at_idx'),
+        ]
 
     def __str__(self):
         return self.full_name
@@ -81,6 +97,14 @@ class Filmwork(UUIDMixin, CreatedAtMixin, UpdatedAtMixin):
         db_table = 'content"."film_work'
         verbose_name = _('Filmwork')
         verbose_name_plural = _('Filmworks')
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='film_work_updated_at_id_idx'),
+            # Keyset pagination of the API.
+            models.Index(fields=['created_at', 'id'], name='film_work_created_at_id_idx'),
+            # Admin search: icontains is UPPER(column) LIKE UPPER('%term%').
+            GinIndex(OpClass(Upper('title'), name='gin_trgm_ops'), name='film_work_title_trgm_idx'),
+            GinIndex(OpClass(Upper('description'), name='gin_trgm_ops'), name='film_work_description_trgm_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -97,6 +121,9 @@ class GenreFilmwork(UUIDMixin, CreatedAtMixin, UpdatedAtMixin):
         constraints = [
             models.UniqueConstraint(fields=['film_work_id', 'genre_id'], name='unique genre for filmwork')
         ]
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='genre_fw_updated_at_id_idx'),
+        ]
 
 
 class PersonFilmwork(UUIDMixin, CreatedAtMixin, UpdatedAtMixin):
@@ -114,6 +141,13 @@ class PersonFilmwork(UUIDMixin, CreatedAtMixin, UpdatedAtMixin):
         db_table = 'content"."person_film_work'
         verbose_name = _('Person')
         verbose_name_plural = _('Persons')
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='person_fw_updated_at_id_idx'),
+            # Filmwork page and ETL enrichment: persons of a filmwork by role.
+            models.Index(fields=['film_work', 'role'], name='person_fw_film_work_role_idx'),
+            # ETL expansion of changed persons to filmworks without touching the table.
+            models.Index(fields=['person'], include=['film_work'], name='person_fw_person_film_work_idx'),
+        ]
         # constraints = [
         #     models.UniqueConstraint(
         #         fields=['film_work_id', 'person_id', 'role'],
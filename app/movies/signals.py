@@ -0,0 +1,43 @@
+"""Invalidation of cached movies API responses and admin autocomplete on changes of the catalogue."""
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from movies import autocomplete
+from movies.api.v1.cache import bump_version
+from movies.models import Filmwork, Genre, GenreFilmwork, Person, PersonFilmwork
+
+CATALOGUE_MODELS = (Filmwork, Person, Genre, GenreFilmwork, PersonFilmwork)
+
+
+def catalogue_changed(sender, instance, signal, **kwargs):
+    # Deleted rows keep their old updated_at, deletions are dated now.
+    updated_at = getattr(instance, 'updated_at', None) if signal is post_save else None
+    changed_at = updated_at.timestamp() if updated_at else None
+    # After commit, so that a concurrent request doesn't cache data from before the change under the new version.
+    transaction.on_commit(lambda: bump_version(changed_at))
+
+
+def names_changed(sender, **kwargs):
+    autocomplete.cache.clear()
+
+
+def catalogue_links_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(bump_version)
+
+
+for model in CATALOGUE_MODELS:
+    post_save.connect(catalogue_changed, sender=model, dispatch_uid='movies_api_cache_save_{0}'.format(model.__name__))
+    post_delete.connect(
+        catalogue_changed, sender=model, dispatch_uid='movies_api_cache_delete_{0}'.format(model.__name__),
+    )
+
+for through_model in (Filmwork.genres.through, Filmwork.persons.through):
+    m2m_changed.connect(
+        catalogue_links_changed,
+        sender=through_model,
+        dispatch_uid='movies_api_cache_links_{0}'.format(through_model.__name__),
+    )
+
+for model in (Person, Genre):
+    post_save.connect(names_changed, sender=model, dispatch_uid='autocomplete_save_{0}'.format(model.__name__))
+    post_delete.connect(names_changed, sender=model, dispatch_uid='autocomplete_delete_{0}'.format(model.__name__))
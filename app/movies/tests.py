@@ -0,0 +1,463 @@
+import datetime
+import importlib.util
+import select
+import threading
+from functools import wraps
+from pathlib import Path
+from unittest import mock
+
+import psycopg2
+import psycopg2.pool
+from asgiref.sync import sync_to_async
+from elastic_transport import ApiResponseMeta, ConnectionTimeout, HttpHeaders, NodeConfig
+from elasticsearch import NotFoundError
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from config.db_backend import base as db_backend
+from movies import autocomplete, bulk
+from movies.api.v1 import async_db, search
+from movies.importer import SELECT_IDS_BY_NAMES
+from movies.models import Filmwork, Genre, GenreFilmwork, Person, PersonFilmwork
+from movies.paginators import planned_count
+
+
+class FilmworkChangelistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.genre = Genre.objects.create(name='Drama')
+        for number in range(30):
+            filmwork = Filmwork.objects.create(title='Star {0}'.format(number), rating=number)
+            if number % 2:
+                GenreFilmwork.objects.create(film_work=filmwork, genre=cls.genre)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse('admin:movies_filmwork_changelist')
+
+    def test_filtered_changelist_queries(self):
+        # Session, user, genres of the filter, the planner estimate of the filtered list,
+        # its exact count as the estimate is small, the page. No COUNT(*) of the whole table.
+        with self.assertNumQueries(6):
+            response = self.client.get(self.url, {'genre': str(self.genre.pk), 'q': 'star'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 15)
+
+    def test_malformed_genre_filter(self):
+        response = self.client.get(self.url, {'genre': 'not-a-uuid'})
+        self.assertRedirects(response, self.url + '?e=1', fetch_redirect_response=False)
+
+    def test_planned_count(self):
+        self.assertIsInstance(planned_count(Filmwork.objects.filter(title__icontains='star')), int)
+
+
+class FilmworkBulkEditTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.genres = [Genre.objects.create(name=name) for name in ('Drama', 'Comedy')]
+        cls.person = Person.objects.create(full_name='Ann Smith')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_inlines_saved_with_one_timestamp(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('admin:movies_filmwork_add'), {
+                'title': 'Star',
+                'type': Filmwork.Filmwork_type.MOVIE,
+                'description': 'A filmwork',
+                'creation_date_0': '2020-01-01',
+                'creation_date_1': '00:00:00',
+                'rating': '7.5',
+                'genrefilmwork_set-TOTAL_FORMS': '2',
+                'genrefilmwork_set-INITIAL_FORMS': '0',
+                'genrefilmwork_set-0-genre': str(self.genres[0].pk),
+                'genrefilmwork_set-1-genre': str(self.genres[1].pk),
+                'personfilmwork_set-TOTAL_FORMS': '1',
+                'personfilmwork_set-INITIAL_FORMS': '0',
+                'personfilmwork_set-0-person': str(self.person.pk),
+                'personfilmwork_set-0-role': PersonFilmwork.RoleChoices.ACTOR,
+            })
+        self.assertEqual(response.status_code, 302)
+        filmwork = Filmwork.objects.get(title='Star')
+        genre_links = GenreFilmwork.objects.filter(film_work=filmwork)
+        self.assertEqual(genre_links.count(), 2)
+        timestamps = {filmwork.updated_at} | {
+            timestamp
+            for link in [*genre_links, *PersonFilmwork.objects.filter(film_work=filmwork)]
+            for timestamp in (link.created_at, link.updated_at)
+        }
+        self.assertEqual(len(timestamps), 1)
+        # New rows of every inline are written by one INSERT and not updated afterwards.
+        for table in ('genre_film_work', 'person_film_work'):
+            statements = [
+                query['sql'].split()[0] for query in queries.captured_queries
+                if '"content"."{0}"'.format(table) in query['sql'] and not query['sql'].startswith('SELECT')
+            ]
+            self.assertEqual(statements, ['INSERT'], table)
+
+    def test_changed_inline_updated_with_filmwork_timestamp(self):
+        filmwork = Filmwork.objects.create(
+            title='Star', type=Filmwork.Filmwork_type.MOVIE, description='A filmwork', rating=7.5,
+            creation_date=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc),
+        )
+        link = GenreFilmwork.objects.create(film_work=filmwork, genre=self.genres[0])
+        response = self.client.post(reverse('admin:movies_filmwork_change', args=[filmwork.pk]), {
+            'title': 'Star',
+            'type': Filmwork.Filmwork_type.MOVIE,
+            'description': 'A filmwork',
+            'creation_date_0': '2020-01-01',
+            'creation_date_1': '00:00:00',
+            'rating': '7.5',
+            'genrefilmwork_set-TOTAL_FORMS': '1',
+            'genrefilmwork_set-INITIAL_FORMS': '1',
+            'genrefilmwork_set-0-id': str(link.pk),
+            'genrefilmwork_set-0-film_work': str(filmwork.pk),
+            'genrefilmwork_set-0-genre': str(self.genres[1].pk),
+            'personfilmwork_set-TOTAL_FORMS': '0',
+            'personfilmwork_set-INITIAL_FORMS': '0',
+        })
+        self.assertEqual(response.status_code, 302)
+        filmwork.refresh_from_db()
+        link.refresh_from_db()
+        self.assertEqual(link.genre, self.genres[1])
+        self.assertEqual(link.updated_at, filmwork.updated_at)
+
+    def test_attach_genre_skips_existing_links(self):
+        filmworks = [Filmwork.objects.create(title='Star {0}'.format(number)) for number in range(3)]
+        GenreFilmwork.objects.create(film_work=filmworks[0], genre=self.genres[0])
+        self.assertEqual(bulk.attach_genre(Filmwork.objects.all(), self.genres[0]), 2)
+        self.assertEqual(GenreFilmwork.objects.filter(genre=self.genres[0]).count(), 3)
+
+
+class MoviesApiCacheTests(TestCase):
+    def test_change_bypassing_signals_misses_cache(self):
+        filmwork = Filmwork.objects.create(title='Star')
+        url = '/api/v1/movies/{0}/'.format(filmwork.pk)
+        self.assertEqual(self.client.get(url).json()['title'], 'Star')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE content.film_work SET title = 'Moon', updated_at = now() + interval '1 second' WHERE id = %s",
+                [filmwork.pk],
+            )
+        response = self.client.get(url)
+        self.assertEqual(response.json()['title'], 'Moon')
+
+
+def load_etl_queries():
+    """SQL of the ETL extractor, from postgres_to_es next to the Django app."""
+    path = Path(__file__).resolve().parents[2] / 'postgres_to_es' / 'db_queries.py'
+    spec = importlib.util.spec_from_file_location('etl_db_queries', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def index_names(plan: dict) -> set:
+    """Names of all indexes scanned by a plan node and its children."""
+    names = {plan['Index Name']} if 'Index Name' in plan else set()
+    for child in plan.get('Plans', []):
+        names |= index_names(child)
+    return names
+
+
+class QueryPlanTests(TestCase):
+    """Queries of the ETL extractor and the catalogue import are served by their indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.queries = load_etl_queries()
+        genre = Genre.objects.create(name='Drama')
+        cls.filmworks = [Filmwork.objects.create(title='Star {0}'.format(number)) for number in range(50)]
+        for number, filmwork in enumerate(cls.filmworks):
+            person = Person.objects.create(full_name='Actor {0}'.format(number))
+            GenreFilmwork.objects.create(film_work=filmwork, genre=genre)
+            PersonFilmwork.objects.create(film_work=filmwork, person=person, role=PersonFilmwork.RoleChoices.ACTOR)
+        cls.person = person
+
+    def explain(self, sql: str, params) -> set:
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE content.film_work, content.genre, content.person, content.person_film_work, content.genre_film_work')
+            # A test database is too small for index scans to be cheaper than sequential ones.
+            # Without sequential scans the planner still falls back to them if no index fits the query.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            return index_names(cursor.fetchone()[0][0]['Plan'])
+
+    def test_change_detection(self):
+        params = {
+            'updated_at': datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc),
+            'id': '00000000-0000-0000-0000-000000000000',
+            'lag_sec': 0,
+            'limit': 100,
+        }
+        for query, index in (
+            (self.queries.SELECT_CHANGED_FILMWORKS_PAGE, 'film_work_updated_at_id_idx'),
+            (self.queries.SELECT_CHANGED_PERSONS_PAGE, 'person_updated_at_id_idx'),
+            (self.queries.SELECT_CHANGED_GENRES_PAGE, 'genre_updated_at_id_idx'),
+            (self.queries.SELECT_CHANGED_PERSON_FILMWORKS_PAGE, 'person_fw_updated_at_id_idx'),
+            (self.queries.SELECT_CHANGED_GENRE_FILMWORKS_PAGE, 'genre_fw_updated_at_id_idx'),
+        ):
+            with self.subTest(index=index):
+                self.assertIn(index, self.explain(query, params))
+
+    def test_person_expansion(self):
+        indexes = self.explain(self.queries.SELECT_FILMWORK_IDS_BY_PERSON_IDS, {'ids': [str(self.person.pk)]})
+        self.assertIn('person_fw_person_film_work_idx', indexes)
+
+    def test_enrichment(self):
+        ids = [str(filmwork.pk) for filmwork in self.filmworks[:10]]
+        self.assertIn('person_fw_film_work_role_idx', self.explain(self.queries.SELECT_FILMWORKS_JSON_BY_IDS, {'ids': ids}))
+
+    def test_import_name_lookup(self):
+        for table, name_column, index in (
+            ('genre', 'name', 'genre_name_created_at_idx'),
+            ('person', 'full_name', 'person_name_created_at_idx'),
+        ):
+            with self.subTest(index=index):
+                sql = SELECT_IDS_BY_NAMES.format(name_column=name_column, table=table)
+                self.assertIn(index, self.explain(sql, [['Drama', 'Actor 1']]))
+
+
+def truncate_content_tables():
+    """
+    Rows committed by a TransactionTestCase.
+
+    Its flush only sees tables found by introspection in the search path, not the models in the content schema.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'TRUNCATE content.film_work, content.genre, content.person, content.genre_film_work, '
+            'content.person_film_work, content.deletion_log'
+        )
+
+
+class ContentChangeNotifyTests(TransactionTestCase):
+    def setUp(self):
+        self.addCleanup(truncate_content_tables)
+        settings = connection.settings_dict
+        self.listener = psycopg2.connect(
+            dbname=settings['NAME'], user=settings['USER'], password=settings['PASSWORD'],
+            host=settings['HOST'], port=settings['PORT'],
+        )
+        self.listener.set_session(autocommit=True)
+        with self.listener.cursor() as cursor:
+            cursor.execute('LISTEN content_changes')
+
+    def tearDown(self):
+        self.listener.close()
+
+    def notifications(self, timeout: float) -> list:
+        select.select([self.listener], [], [], timeout)
+        self.listener.poll()
+        payloads = [notify.payload for notify in self.listener.notifies]
+        self.listener.notifies.clear()
+        return payloads
+
+    def test_notify_setting(self):
+        Filmwork.objects.create(title='Star')
+        self.assertEqual(self.notifications(0.1), [])
+        with connection.cursor() as cursor:
+            cursor.execute("SET content.notify = 'on'")
+        try:
+            filmwork = Filmwork.objects.create(title='Moon')
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('RESET content.notify')
+        self.assertEqual(self.notifications(5), ['film_work:{0}'.format(filmwork.pk)])
+
+
+class ConnectionPoolTests(TransactionTestCase):
+    def setUp(self):
+        connection.close()
+        self.settings_dict = connection.settings_dict.copy()
+        connection.settings_dict.update({'CONN_HEALTH_CHECKS': True, 'POOL': {'min_size': 1, 'max_size': 2}})
+
+    def tearDown(self):
+        connection.close()
+        connection.settings_dict.clear()
+        connection.settings_dict.update(self.settings_dict)
+        db_backend._pools.pop(connection.alias).closeall()
+
+    def test_request_on_new_pool_connection(self):
+        # The first request of a process gets a connection just opened by the pool.
+        response = self.client.get('/api/v1/movies/')
+        self.assertEqual(response.status_code, 200)
+
+
+class BlockingConnectionPoolTests(TestCase):
+    def test_pool_waits_for_free_connection(self):
+        pool = db_backend.BlockingConnectionPool(0, 1, 5, **connection.get_connection_params())
+        self.addCleanup(pool.closeall)
+        taken = pool.getconn()
+        waiting = threading.Thread(target=lambda: pool.putconn(pool.getconn()))
+        waiting.start()
+        waiting.join(0.2)
+        self.assertTrue(waiting.is_alive())
+        pool.putconn(taken)
+        waiting.join(5)
+        self.assertFalse(waiting.is_alive())
+
+    def test_pool_timeout(self):
+        pool = db_backend.BlockingConnectionPool(0, 1, 0.1, **connection.get_connection_params())
+        self.addCleanup(pool.closeall)
+        pool.getconn()
+        with self.assertRaises(psycopg2.pool.PoolError):
+            pool.getconn()
+
+
+class FailingEsClient:
+    def __init__(self, error: Exception):
+        self.error = error
+
+    def search(self, **kwargs):
+        raise self.error
+
+
+class AsyncFailingEsClient(FailingEsClient):
+    async def search(self, **kwargs):
+        raise self.error
+
+
+def es_errors() -> list:
+    meta = ApiResponseMeta(404, 'HTTP/1.1', HttpHeaders(), 0.0, NodeConfig('http', 'localhost', 9200))
+    return [
+        ConnectionTimeout('Connection timed out'),
+        NotFoundError('index_not_found_exception', meta, {'error': 'no such index [movies]'}),
+    ]
+
+
+class SearchUnavailableTests(SimpleTestCase):
+    url = '/api/v1/movies/search/?query=star'
+
+    def test_sync_search(self):
+        for error in es_errors():
+            with self.subTest(error=type(error).__name__), \
+                    mock.patch.object(search, '_es_client', FailingEsClient(error)):
+                self.assertEqual(self.client.get(self.url).status_code, 503)
+
+    @override_settings(ROOT_URLCONF='config.urls_asgi')
+    async def test_async_search(self):
+        for error in es_errors():
+            with self.subTest(error=type(error).__name__), \
+                    mock.patch.object(search, '_async_es_client', AsyncFailingEsClient(error)):
+                response = await self.async_client.get(self.url)
+                self.assertEqual(response.status_code, 503)
+
+
+def closing_async_pool(test):
+    """The async DB pool is opened in the event loop of a test, and has to be closed in it."""
+    @wraps(test)
+    async def wrapper(self):
+        try:
+            await test(self)
+        finally:
+            if async_db._pool is not None:
+                await async_db._pool.close()
+                async_db._pool = None
+    return wrapper
+
+
+class AsyncMoviesApiTests(TransactionTestCase):
+    """Async views of the ASGI server answer as the DRF viewset does."""
+
+    def setUp(self):
+        self.addCleanup(truncate_content_tables)
+        genres = [Genre.objects.create(name=name) for name in ('Drama', 'Comedy')]
+        persons = [Person.objects.create(full_name=full_name) for full_name in ('Ann Smith', 'Bob Jones')]
+        self.filmworks = []
+        for number in range(5):
+            filmwork = Filmwork.objects.create(title='Star {0}'.format(number), rating=number, description='Ünïcode')
+            GenreFilmwork.objects.create(film_work=filmwork, genre=genres[number % 2])
+            PersonFilmwork.objects.create(film_work=filmwork, person=persons[0], role=PersonFilmwork.RoleChoices.ACTOR)
+            PersonFilmwork.objects.create(film_work=filmwork, person=persons[1], role=PersonFilmwork.RoleChoices.DIRECTOR)
+            self.filmworks.append(filmwork)
+        # Responses of one path would be served to the other from the cache.
+        cache_settings = override_settings(MOVIES_API_CACHE={**settings.MOVIES_API_CACHE, 'ENABLED': False})
+        cache_settings.enable()
+        self.addCleanup(cache_settings.disable)
+
+    async def get_sync(self, url: str, **extra):
+        return await sync_to_async(self.client.get)(url, **extra)
+
+    async def get_async(self, url: str, **extra):
+        with override_settings(ROOT_URLCONF='config.urls_asgi'):
+            # Headers of the async client are passed without the `HTTP_` prefix.
+            return await self.async_client.get(url, **extra)
+
+    async def assert_same_responses(self, url: str, **extra):
+        sync_response = await self.get_sync(url, **extra)
+        async_response = await self.get_async(url, **extra)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(async_response.json(), sync_response.json())
+        self.assertEqual(async_response.get('ETag'), sync_response.get('ETag'))
+        return async_response
+
+    @closing_async_pool
+    async def test_list_and_detail(self):
+        await self.assert_same_responses('/api/v1/movies/')
+        await self.assert_same_responses('/api/v1/movies/{0}/'.format(self.filmworks[0].pk))
+        await self.assert_same_responses('/api/v1/movies/00000000-0000-0000-0000-000000000000/')
+
+    @closing_async_pool
+    async def test_cursor_pages(self):
+        url = '/api/v1/movies/?page_size=2'
+        pages = 0
+        while url:
+            url = (await self.assert_same_responses(url)).json()['next']
+            pages += 1
+        self.assertEqual(pages, 3)
+
+    @closing_async_pool
+    async def test_page_number_fallback(self):
+        response = await self.assert_same_responses('/api/v1/movies/?page=2&page_size=2')
+        self.assertEqual(response.json()['total_pages'], 3)
+
+    @closing_async_pool
+    async def test_not_modified(self):
+        for url in ('/api/v1/movies/', '/api/v1/movies/{0}/'.format(self.filmworks[0].pk)):
+            with self.subTest(url=url):
+                etag = (await self.get_sync(url))['ETag']
+                response = await self.get_async(url, **{'If-None-Match': etag})
+                self.assertEqual(response.status_code, 304)
+
+
+class AdminAutocompleteTests(TestCase):
+    url = '/admin/autocomplete/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        for full_name in ('Smithson John', 'Ann Smith', 'Smith Bob', 'Jane Doe'):
+            Person.objects.create(full_name=full_name)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        autocomplete.cache.clear()
+
+    def names(self, term: str) -> list:
+        response = self.client.get(self.url, {
+            'app_label': 'movies', 'model_name': 'personfilmwork', 'field_name': 'person', 'term': term,
+        })
+        self.assertEqual(response.status_code, 200)
+        return [result['text'] for result in response.json()['results']]
+
+    def test_prefix_before_trigrams(self):
+        self.assertEqual(self.names('smith'), ['Smith Bob', 'Smithson John', 'Ann Smith'])
+
+    @override_settings(ADMIN_AUTOCOMPLETE={**settings.ADMIN_AUTOCOMPLETE, 'LIMIT': 2})
+    def test_limit(self):
+        self.assertEqual(self.names('smith'), ['Smith Bob', 'Smithson John'])
+
+    def test_name_added_without_signals(self):
+        self.assertEqual(self.names('doe'), ['Jane Doe'])
+        # As by another process: this process' cache is not cleared by signals.
+        Person.objects.bulk_create([Person(full_name='Doe Ray')])
+        self.assertEqual(self.names('doe'), ['Doe Ray', 'Jane Doe'])
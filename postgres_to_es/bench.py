@@ -0,0 +1,321 @@
+"""
+ETL benchmark: change detection, extract, transform and load timed separately on a synthetic catalogue.
+
+`generate` fills the content schema of a local PG (DB_* env vars) with filmworks, persons and genres,
+`run` times the ETL stages against it. Docs are loaded into ES_HOST, or into a local stub of the ES bulk API
+if ES_HOST is not given, so that only our side of the load is measured.
+"""
+import argparse
+import datetime
+import io
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List
+
+from elasticsearch import Elasticsearch
+from es import ES_INDEX_NAME, es_doc_builder
+from etl import connect_pg, transfer
+from etl_config import (ES_BULK_SETTINGS, ETL_PERSONS_AS_JSON,
+                        ETL_PIPELINE_SETTINGS, ETL_VALIDATE_DOCS)
+from extract import extract_changed_chunks, extract_filmworks
+from loader import load
+
+ROLES = ('actor', 'director', 'writer')
+
+GENERATED_TABLES = ('genre', 'person', 'film_work', 'genre_film_work', 'person_film_work')
+
+TABLE_COLUMNS = {
+    'genre': ('id', 'name', 'description', 'created_at', 'updated_at'),
+    'person': ('id', 'full_name', 'created_at', 'updated_at'),
+    'film_work': ('id', 'title', 'description', 'creation_date', 'rating', 'type', 'created_at', 'updated_at'),
+    'genre_film_work': ('id', 'film_work_id', 'genre_id', 'created_at', 'updated_at'),
+    'person_film_work': ('id', 'film_work_id', 'person_id', 'role', 'created_at', 'updated_at'),
+}
+
+# Rows written to PG with a single COPY.
+COPY_BATCH_SIZE = 10000
+
+# ETL logs every bulk response and every page of changes at DEBUG, which would be measured along with the stages.
+for logger_name in ('etl', 'extract', 'loader', 'pipeline'):
+    logging.getLogger(logger_name).setLevel(logging.INFO)
+
+
+class CatalogueGenerator:
+    """Rows of a random catalogue with a fixed number of genres and persons per filmwork. Same seed, same rows."""
+
+    def __init__(
+        self,
+        filmworks: int,
+        persons: int,
+        genres: int,
+        persons_per_filmwork: int,
+        genres_per_filmwork: int,
+        seed: int = 0,
+    ):
+        self.rng = random.Random(seed)
+        self.filmworks = filmworks
+        self.persons_per_filmwork = min(persons_per_filmwork, persons)
+        self.genres_per_filmwork = min(genres_per_filmwork, genres)
+        # Rows get distinct updated_at, so that change detection pages through them like through real edits.
+        self.started = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=1)
+        self.genre_ids = [self.uuid() for _ in range(genres)]
+        self.person_ids = [self.uuid() for _ in range(persons)]
+
+    def uuid(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def timestamp(self, number: int) -> datetime.datetime:
+        return self.started + datetime.timedelta(microseconds=number)
+
+    def genres(self):
+        for number, genre_id in enumerate(self.genre_ids):
+            changed_at = self.timestamp(number)
+            yield 'genre', (genre_id, 'Genre {0}'.format(number), None, changed_at, changed_at)
+
+    def persons(self):
+        for number, person_id in enumerate(self.person_ids):
+            changed_at = self.timestamp(number)
+            yield 'person', (person_id, 'Person {0}'.format(number), changed_at, changed_at)
+
+    def filmworks_with_links(self):
+        for number in range(self.filmworks):
+            filmwork_id = self.uuid()
+            changed_at = self.timestamp(number)
+            yield 'film_work', (
+                filmwork_id,
+                'Title {0}'.format(number),
+                'Description of filmwork {0}'.format(number),
+                datetime.datetime(self.rng.randint(1920, 2022), 1, 1, tzinfo=datetime.timezone.utc),
+                round(self.rng.uniform(0, 10), 1),
+                self.rng.choice(('movie', 'tv_show')),
+                changed_at,
+                changed_at,
+            )
+            for genre_id in self.rng.sample(self.genre_ids, self.genres_per_filmwork):
+                yield 'genre_film_work', (self.uuid(), filmwork_id, genre_id, changed_at, changed_at)
+            for person_id in self.rng.sample(self.person_ids, self.persons_per_filmwork):
+                yield 'person_film_work', (
+                    self.uuid(), filmwork_id, person_id, self.rng.choice(ROLES), changed_at, changed_at,
+                )
+
+    def rows(self):
+        """(table, row) in the order of foreign keys."""
+        yield from self.genres()
+        yield from self.persons()
+        yield from self.filmworks_with_links()
+
+
+def to_copy_value(value) -> str:
+    if value is None:
+        return '\\N'
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def copy_rows(pg_cursor, table: str, rows: List[tuple]):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(to_copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    pg_cursor.copy_expert(
+        'COPY content.{0} ({1}) FROM STDIN'.format(table, ', '.join(TABLE_COLUMNS[table])), buffer,
+    )
+
+
+def generate(pg_connection, generator: CatalogueGenerator, truncate: bool) -> Dict[str, int]:
+    """Write generated rows with COPY in one transaction. Returns the number of rows by table."""
+    counts = {table: 0 for table in GENERATED_TABLES}
+    pending = {table: [] for table in GENERATED_TABLES}
+    with pg_connection, pg_connection.cursor() as pg_cursor:
+        if truncate:
+            pg_cursor.execute('TRUNCATE {0}, content.deletion_log'.format(
+                ', '.join('content.{0}'.format(table) for table in GENERATED_TABLES),
+            ))
+        for table, row in generator.rows():
+            pending[table].append(row)
+            if len(pending[table]) < COPY_BATCH_SIZE:
+                continue
+            # All tables are flushed in the order of foreign keys, so that links refer to rows copied already.
+            for flushed_table in GENERATED_TABLES:
+                copy_rows(pg_cursor, flushed_table, pending[flushed_table])
+                counts[flushed_table] += len(pending[flushed_table])
+                pending[flushed_table] = []
+        for table in GENERATED_TABLES:
+            copy_rows(pg_cursor, table, pending[table])
+            counts[table] += len(pending[table])
+        pg_cursor.execute('ANALYZE {0}'.format(
+            ', '.join('content.{0}'.format(table) for table in GENERATED_TABLES),
+        ))
+    return counts
+
+
+class StubBulkHandler(BaseHTTPRequestHandler):
+    """Accepts bulk requests and answers that every action succeeded. Other requests get an empty JSON object."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def send_json(self, body: dict):
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        # The client refuses to talk to a server without it.
+        self.send_header('X-Elastic-Product', 'Elasticsearch')
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.path.split('?')[0].endswith('/_bulk'):
+            self.send_json({})
+            return
+        items = []
+        lines = iter(body.splitlines())
+        for line in lines:
+            if not line.strip():
+                continue
+            op_type, meta = next(iter(json.loads(line).items()))
+            if op_type != 'delete':
+                # Skip the doc.
+                next(lines, None)
+            items.append({op_type: {'_id': meta.get('_id'), 'status': 200 if op_type == 'delete' else 201}})
+        self.send_json({'took': 0, 'errors': False, 'items': items})
+
+    do_PUT = do_POST
+
+    def do_GET(self):
+        self.send_json({})
+
+    def log_message(self, format, *args):
+        """Requests are not logged, there are too many of them."""
+
+
+def start_es_stub() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubBulkHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def timed(stage: Callable, repeat: int):
+    """Result of the last run of `stage` and the best time out of `repeat` runs."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = stage()
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def stage_result(items: int, seconds: float) -> dict:
+    return {'items': items, 'seconds': round(seconds, 4), 'per_sec': round(items / seconds, 1) if seconds else None}
+
+
+def run(pg_connection, es_client: Elasticsearch, repeat: int) -> dict:
+    """Time every ETL stage over the whole catalogue, stage by stage and end to end."""
+    fetch_size = ETL_PIPELINE_SETTINGS['fetch_size']
+    results = {}
+
+    def detect():
+        filmwork_ids = set()
+        for chunk in extract_changed_chunks(pg_connection, {}, page_size=1000, lag_sec=0):
+            filmwork_ids.update(chunk.filmwork_ids)
+        return filmwork_ids
+
+    filmwork_ids, seconds = timed(detect, repeat)
+    results['detect'] = stage_result(len(filmwork_ids), seconds)
+
+    rows, seconds = timed(
+        lambda: list(extract_filmworks(pg_connection, filmwork_ids, ETL_PERSONS_AS_JSON, fetch_size)), repeat,
+    )
+    results['extract'] = stage_result(len(rows), seconds)
+
+    create_es_doc = es_doc_builder(ETL_VALIDATE_DOCS)
+    docs, seconds = timed(lambda: [create_es_doc(row) for row in rows], repeat)
+    results['transform'] = stage_result(len(docs), seconds)
+
+    bulk_stats, seconds = timed(
+        lambda: load(es_client=es_client, actions=docs, index=ES_INDEX_NAME, **ES_BULK_SETTINGS), repeat,
+    )
+    results['load'] = stage_result(bulk_stats.loaded, seconds)
+    results['load']['errors'] = bulk_stats.errors
+
+    # All stages at once, overlapping in the pipeline if it is on.
+    bulk_stats, seconds = timed(lambda: transfer(pg_connection, es_client, filmwork_ids, ES_INDEX_NAME), repeat)
+    results['transfer'] = stage_result(bulk_stats.loaded, seconds)
+    results['transfer']['errors'] = bulk_stats.errors
+    return results
+
+
+def print_results(results: dict):
+    for stage, result in results['stages'].items():
+        print('{0:<10} {1:>8} items {2:>9.3f}s {3:>10.0f}/s'.format(
+            stage, result['items'], result['seconds'], result['per_sec'] or 0,
+        ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    generate_parser = subparsers.add_parser('generate', help='fill PG with a synthetic catalogue')
+    generate_parser.add_argument('--filmworks', type=int, default=10000)
+    generate_parser.add_argument('--persons', type=int, default=5000)
+    generate_parser.add_argument('--genres', type=int, default=30)
+    generate_parser.add_argument('--persons-per-filmwork', type=int, default=10)
+    generate_parser.add_argument('--genres-per-filmwork', type=int, default=3)
+    generate_parser.add_argument('--seed', type=int, default=0)
+    generate_parser.add_argument('--truncate', action='store_true', help='delete the whole catalogue first')
+
+    run_parser = subparsers.add_parser('run', help='time ETL stages on the catalogue in PG')
+    run_parser.add_argument('--repeat', type=int, default=3, help='best time out of this many runs of every stage')
+    run_parser.add_argument('--json', action='store_true', help='print results as JSON')
+
+    args = parser.parse_args()
+    pg_connection = connect_pg()
+
+    if args.command == 'generate':
+        generator = CatalogueGenerator(
+            args.filmworks, args.persons, args.genres, args.persons_per_filmwork, args.genres_per_filmwork, args.seed,
+        )
+        started = time.perf_counter()
+        counts = generate(pg_connection, generator, args.truncate)
+        print(json.dumps({'rows': counts, 'seconds': round(time.perf_counter() - started, 2)}))
+        sys.exit()
+
+    es_stub = None
+    es_host = os.environ.get('ES_HOST')
+    if es_host is None:
+        es_stub = start_es_stub()
+        es_host = 'http://127.0.0.1:{0}'.format(es_stub.server_address[1])
+    es_client = Elasticsearch(hosts=es_host, connections_per_node=max(10, ES_BULK_SETTINGS['workers']))
+
+    results = {
+        'settings': {
+            'es': 'stub' if es_stub else es_host,
+            'persons_as_json': ETL_PERSONS_AS_JSON,
+            'validate_docs': ETL_VALIDATE_DOCS,
+            'pipeline': ETL_PIPELINE_SETTINGS['enabled'],
+            'fetch_size': ETL_PIPELINE_SETTINGS['fetch_size'],
+            'bulk_workers': ES_BULK_SETTINGS['workers'],
+            'bulk_chunk_size': ES_BULK_SETTINGS['chunk_size'],
+            'repeat': args.repeat,
+        },
+        'stages': run(pg_connection, es_client, args.repeat),
+    }
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print_results(results)
+    if any(result.get('errors') for result in results['stages'].values()):
+        sys.exit(1)
@@ -0,0 +1,71 @@
+"""Micro-benchmark: pydantic doc validation vs direct doc building on generated rows."""
+import argparse
+import datetime
+import random
+import time
+import uuid
+
+from es import build_es_doc, validate_row_create_es_doc
+
+ROLES = ('actor', 'director', 'writer')
+
+
+def generate_rows(count: int, persons_per_row: int, persons_as_json: bool = False, seed: int = 0):
+    """Rows shaped like the result of the enrichment query."""
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(count):
+        filmwork_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        row = {
+            'id': filmwork_id,
+            'title': 'Title {0}'.format(filmwork_id[:8]),
+            'description': 'Description {0}'.format(filmwork_id),
+            'imdb_rating': round(rng.uniform(0, 10), 1),
+            'creation_date': datetime.datetime(rng.randint(1920, 2022), 1, 1, tzinfo=datetime.timezone.utc),
+            'type': rng.choice(['movie', 'tv_show']),
+            'genre': sorted(rng.sample(['Action', 'Comedy', 'Drama', 'Sci-Fi', 'Western'], 2), reverse=True),
+        }
+        persons = [
+            (str(uuid.UUID(int=rng.getrandbits(128))), rng.choice(ROLES), 'Person {0}'.format(i))
+            for i in range(persons_per_row)
+        ]
+        if persons_as_json:
+            row['persons_by_role'] = {
+                role: [{'id': p_id, 'name': name} for p_id, p_role, name in persons if p_role == role]
+                for role in ROLES
+            }
+        else:
+            row['persons'] = [':::'.join(person) for person in persons] or [None]
+        rows.append(row)
+    return rows
+
+
+def bench(transform, rows, repeat: int) -> float:
+    """Best rows per second out of `repeat` runs."""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for row in rows:
+            transform(row)
+        best = min(best, time.perf_counter() - started)
+    return len(rows) / best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--persons', type=int, default=10, help='persons per filmwork')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='persons split by role in PG, as with ETL_PERSONS_AS_JSON')
+    args = parser.parse_args()
+
+    rows = generate_rows(args.rows, args.persons, args.json)
+    mismatched = [row['id'] for row in rows if build_es_doc(row) != validate_row_create_es_doc(row)]
+    if mismatched:
+        raise SystemExit('Docs differ for {0} rows, e.g. {1}'.format(len(mismatched), mismatched[0]))
+
+    validated = bench(validate_row_create_es_doc, rows, args.repeat)
+    direct = bench(build_es_doc, rows, args.repeat)
+    print('validate_row_create_es_doc: {0:>10.0f} rows/s'.format(validated))
+    print('build_es_doc:               {0:>10.0f} rows/s'.format(direct))
+    print('speedup:                    {0:>10.1f}x'.format(direct / validated))
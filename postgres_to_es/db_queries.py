@@ -24,20 +24,128 @@ limit 1
 UPSERT_LAST_SUCCESSFUL_LOAD_TIME = """
 INSERT OR
 REPLACE INTO states (load_time, successful, created_at)
-VALUES ('{0}', {1}, '{2}');
+VALUES (?, ?, ?);
 """
 
+# High-watermark of every source table: the last (updated_at, id) loaded into ES.
+CREATE_WATERMARKS_TABLE = """
+create table if not exists watermarks
+(
+    source     TEXT      primary key,
+    updated_at TEXT                                not null,
+    id         TEXT                                not null,
+    saved_at   TIMESTAMP default CURRENT_TIMESTAMP not null
+);
+"""
+
+SELECT_WATERMARKS = """
+select source, updated_at, id
+from watermarks
+"""
+
+UPSERT_WATERMARK = """
+INSERT OR
+REPLACE INTO watermarks (source, updated_at, id, saved_at)
+VALUES (?, ?, ?, CURRENT_TIMESTAMP);
+"""
+
+# Hashes of docs as last loaded into ES, to skip sending unchanged docs again.
+CREATE_DOC_HASHES_TABLE = """
+create table if not exists doc_hashes
+(
+    id   TEXT primary key,
+    hash TEXT not null
+) without rowid;
+"""
+
+# Formatted with one `?` per id.
+SELECT_DOC_HASHES = """
+select id, hash
+from doc_hashes
+where id in ({placeholders})
+"""
+
+UPSERT_DOC_HASH = """
+INSERT OR
+REPLACE INTO doc_hashes (id, hash)
+VALUES (?, ?);
+"""
+
+DELETE_DOC_HASHES = 'delete from doc_hashes;'
+
 DELETE_OLD_STATES = """
 delete
 from states
 where created_at < DATETIME('now', '-1 year')
 """
 
-SELECT_UPDATED_FILMWORKS = """
+# Change detection: every source table is paged through separately in (updated_at, id) order,
+# starting after the table's watermark, so the cost of a poll depends on the number of changes,
+# not on the catalogue size. `ref_id` is the filmwork id for film_work and m2m tables,
+# and the id to expand to filmworks for person and genre.
+# Rows changed in the last `lag_sec` seconds are left for the next poll: transactions that set
+# updated_at earlier, but are not committed yet, would be skipped otherwise.
+SELECT_CHANGES_PAGE = """
+select id, updated_at, {ref_column} AS ref_id
+from content.{table}
+where (updated_at, id) > (%(updated_at)s, %(id)s::uuid)
+  and updated_at < statement_timestamp() - %(lag_sec)s * interval '1 second'
+order by updated_at, id
+limit %(limit)s;
+"""
+
+SELECT_CHANGED_FILMWORKS_PAGE = SELECT_CHANGES_PAGE.format(table='film_work', ref_column='id')
+SELECT_CHANGED_PERSON_FILMWORKS_PAGE = SELECT_CHANGES_PAGE.format(table='person_film_work', ref_column='film_work_id')
+SELECT_CHANGED_GENRE_FILMWORKS_PAGE = SELECT_CHANGES_PAGE.format(table='genre_film_work', ref_column='film_work_id')
+SELECT_CHANGED_PERSONS_PAGE = SELECT_CHANGES_PAGE.format(table='person', ref_column='id')
+SELECT_CHANGED_GENRES_PAGE = SELECT_CHANGES_PAGE.format(table='genre', ref_column='id')
+# Filmworks that were deleted or lost a person or a genre, logged by triggers.
+SELECT_DELETED_FILMWORKS_PAGE = SELECT_CHANGES_PAGE.format(table='deletion_log', ref_column='film_work_id')
+
+DELETE_OLD_DELETION_LOG = """
+delete
+from content.deletion_log
+where updated_at < now() - %(retention_days)s * interval '1 day';
+"""
+
+SELECT_ALL_FILMWORK_IDS = 'select id from content.film_work;'
+
+# Ids of filmworks in one shard. Shard of a filmwork is the last 32 bits of its uuid modulo number of shards.
+SELECT_SHARD_FILMWORK_IDS = """
+select id
+from content.film_work
+where ('x' || right(id::text, 8))::bit(32)::bigint %% %(shard_count)s = %(shard_index)s;
+"""
+
+# Latest change in a source table, to start incremental loads after a full reindex.
+SELECT_LATEST_CHANGE = """
+select updated_at, id
+from content.{table}
+order by updated_at DESC, id DESC
+limit 1;
+"""
+
+# Expansion of changed persons and genres to the filmworks they appear in.
+SELECT_FILMWORK_IDS_BY_PERSON_IDS = """
+select distinct film_work_id AS id
+from content.person_film_work
+where person_id = ANY(%(ids)s::uuid[]);
+"""
+
+SELECT_FILMWORK_IDS_BY_GENRE_IDS = """
+select distinct film_work_id AS id
+from content.genre_film_work
+where genre_id = ANY(%(ids)s::uuid[]);
+"""
+
+# Enrichment: full data only for the filmworks found by change detection.
+SELECT_FILMWORKS_BY_IDS = """
 select fw.id                                           AS                id,
        fw.title                                        AS                title,
        fw.description                                  AS                description,
        fw.rating                                       AS                imdb_rating,
+       fw.creation_date                                AS                creation_date,
+       fw.type                                         AS                type,
        ARRAY_AGG(DISTINCT g.name ORDER BY g.name DESC) AS                genre,
        ARRAY_AGG(DISTINCT p.id || ':::' || pfw.role || ':::' || p.full_name) persons
 from content.film_work fw
@@ -45,12 +153,56 @@ from content.film_work fw
          left join content.person p on pfw.person_id = p.id
          left join content.genre_film_work gfw on fw.id = gfw.film_work_id
          left join content.genre g on gfw.genre_id = g.id
-group by fw.id
-having MAX(fw.updated_at) > '{0}'
-    OR MAX(p.updated_at) > '{0}'
-    OR MAX(gfw.updated_at) > '{0}'
-    OR MAX(pfw.updated_at) > '{0}'
-    OR MAX(g.updated_at) > '{0}';
+where fw.id = ANY(%(ids)s::uuid[])
+group by fw.id;
         """
 
+# Same data, but persons come as JSON already split by role: {"director": [{"id": ..., "name": ...}], ...}.
+# Lateral subqueries avoid multiplying persons by genres, and use the (film_work_id, role) index.
+SELECT_FILMWORKS_JSON_BY_IDS = """
+select fw.id                    AS id,
+       fw.title                 AS title,
+       fw.description           AS description,
+       fw.rating                AS imdb_rating,
+       fw.creation_date         AS creation_date,
+       fw.type                  AS type,
+       coalesce(g.genre, '{}')  AS genre,
+       jsonb_build_object(
+           'director', coalesce(p.directors, '[]'),
+           'actor', coalesce(p.actors, '[]'),
+           'writer', coalesce(p.writers, '[]')
+       )                        AS persons_by_role
+from content.film_work fw
+         left join lateral (
+    select ARRAY_AGG(DISTINCT g.name ORDER BY g.name DESC) AS genre
+    from content.genre_film_work gfw
+             join content.genre g on gfw.genre_id = g.id
+    where gfw.film_work_id = fw.id
+    ) g on true
+         left join lateral (
+    select jsonb_agg(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name))
+           filter (where pfw.role = 'director') AS directors,
+           jsonb_agg(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name))
+           filter (where pfw.role = 'actor')    AS actors,
+           jsonb_agg(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name))
+           filter (where pfw.role = 'writer')   AS writers
+    from content.person_film_work pfw
+             join content.person p on pfw.person_id = p.id
+    where pfw.film_work_id = fw.id
+    ) p on true
+where fw.id = ANY(%(ids)s::uuid[]);
+"""
+
 SELECT_ONE_FILMWORK = 'select id from content.film_work limit 1'
+
+# Shard claims of ETL workers. Session level advisory locks are released by PG when a worker's connection dies.
+TRY_LOCK_SHARD = 'select pg_try_advisory_lock(%(lock_class)s, %(shard_index)s) as locked;'
+
+UNLOCK_SHARD = 'select pg_advisory_unlock(%(lock_class)s, %(shard_index)s);'
+
+COUNT_LIVE_WORKERS = """
+select count(*) as workers
+from pg_stat_activity
+where application_name = %(application_name)s
+  and datname = current_database();
+"""
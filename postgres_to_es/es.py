@@ -1,127 +1,206 @@
 """ES related functions: create index, create doc."""
 from __future__ import annotations
 
+import datetime
 from typing import List, Optional
 
-from db_queries import SELECT_UPDATED_FILMWORKS
+from extract import extract_filmworks
 from pydantic import BaseModel, Field
 
+# Alias that always points to the live versioned index: movies_v1, movies_v2...
 ES_INDEX_NAME = 'movies'
+ES_INDEX_VERSION_PREFIX = '{0}_v'.format(ES_INDEX_NAME)
 
+ES_INDEX_SETTINGS = {
+    'refresh_interval': '1s',
+    'analysis': {
+        'filter': {
+            'english_stop': {
+                'type': 'stop',
+                'stopwords': '_english_',
+            },
+            'english_stemmer': {
+                'type': 'stemmer',
+                'language': 'english',
+            },
+            'english_possessive_stemmer': {
+                'type': 'stemmer',
+                'language': 'possessive_english',
+            },
+            'russian_stop': {
+                'type': 'stop',
+                'stopwords': '_russian_',
+            },
+            'russian_stemmer': {
+                'type': 'stemmer',
+                'language': 'russian',
+            },
+        },
+        'analyzer': {
+            'ru_en': {
+                'tokenizer': 'standard',
+                'filter': [
+                    'lowercase',
+                    'english_stop',
+                    'english_stemmer',
+                    'english_possessive_stemmer',
+                    'russian_stop',
+                    'russian_stemmer',
+                ],
+            },
+        },
+    },
+}
 
-def es_create_index(client):
-    """Create an index in Elasticsearch if one isn't already there."""
-    client.indices.create(
-        index=ES_INDEX_NAME,
-        body={
-            'settings': {
-                'refresh_interval': '1s',
-                'analysis': {
-                    'filter': {
-                        'english_stop': {
-                            'type': 'stop',
-                            'stopwords': '_english_',
-                        },
-                        'english_stemmer': {
-                            'type': 'stemmer',
-                            'language': 'english',
-                        },
-                        'english_possessive_stemmer': {
-                            'type': 'stemmer',
-                            'language': 'possessive_english',
-                        },
-                        'russian_stop': {
-                            'type': 'stop',
-                            'stopwords': '_russian_',
-                        },
-                        'russian_stemmer': {
-                            'type': 'stemmer',
-                            'language': 'russian',
-                        },
-                    },
-                    'analyzer': {
-                        'ru_en': {
-                            'tokenizer': 'standard',
-                            'filter': [
-                                'lowercase',
-                                'english_stop',
-                                'english_stemmer',
-                                'english_possessive_stemmer',
-                                'russian_stop',
-                                'russian_stemmer',
-                            ],
-                        },
-                    },
+ES_INDEX_MAPPINGS = {
+    'dynamic': 'strict',
+    'properties': {
+        'id': {
+            'type': 'keyword',
+        },
+        'imdb_rating': {
+            'type': 'float',
+        },
+        'creation_date': {
+            'type': 'date',
+        },
+        'type': {
+            'type': 'keyword',
+        },
+        'genre': {
+            'type': 'keyword',
+        },
+        'title': {
+            'type': 'text',
+            'analyzer': 'ru_en',
+            'fields': {
+                'raw': {
+                    'type': 'keyword',
                 },
             },
-            'mappings': {
-                'dynamic': 'strict',
-                'properties': {
-                    'id': {
-                        'type': 'keyword',
-                    },
-                    'imdb_rating': {
-                        'type': 'float',
-                    },
-                    'genre': {
-                        'type': 'keyword',
-                    },
-                    'title': {
-                        'type': 'text',
-                        'analyzer': 'ru_en',
-                        'fields': {
-                            'raw': {
-                                'type': 'keyword',
-                            },
-                        },
-                    },
-                    'description': {
-                        'type': 'text',
-                        'analyzer': 'ru_en',
-                    },
-                    'director': {
-                        'type': 'text',
-                        'analyzer': 'ru_en',
-                    },
-                    'actors_names': {
-                        'type': 'text',
-                        'analyzer': 'ru_en',
-                    },
-                    'writers_names': {
-                        'type': 'text',
-                        'analyzer': 'ru_en',
-                    },
-                    'actors': {
-                        'type': 'nested',
-                        'dynamic': 'strict',
-                        'properties': {
-                            'id': {
-                                'type': 'keyword',
-                            },
-                            'name': {
-                                'type': 'text',
-                                'analyzer': 'ru_en',
-                            },
-                        },
-                    },
-                    'writers': {
-                        'type': 'nested',
-                        'dynamic': 'strict',
-                        'properties': {
-                            'id': {
-                                'type': 'keyword',
-                            },
-                            'name': {
-                                'type': 'text',
-                                'analyzer': 'ru_en',
-                            },
-                        },
-                    },
+        },
+        'description': {
+            'type': 'text',
+            'analyzer': 'ru_en',
+        },
+        'director': {
+            'type': 'text',
+            'analyzer': 'ru_en',
+        },
+        'actors_names': {
+            'type': 'text',
+            'analyzer': 'ru_en',
+        },
+        'writers_names': {
+            'type': 'text',
+            'analyzer': 'ru_en',
+        },
+        'actors': {
+            'type': 'nested',
+            'dynamic': 'strict',
+            'properties': {
+                'id': {
+                    'type': 'keyword',
+                },
+                'name': {
+                    'type': 'text',
+                    'analyzer': 'ru_en',
                 },
             },
         },
-        ignore=400,
+        'writers': {
+            'type': 'nested',
+            'dynamic': 'strict',
+            'properties': {
+                'id': {
+                    'type': 'keyword',
+                },
+                'name': {
+                    'type': 'text',
+                    'analyzer': 'ru_en',
+                },
+            },
+        },
+    },
+}
+
+
+def versioned_index_name(version: int) -> str:
+    return '{0}{1}'.format(ES_INDEX_VERSION_PREFIX, version)
+
+
+def es_index_versions(client) -> List[int]:
+    """Versions of all existing versioned indices, oldest first."""
+    versions = []
+    for index_name in client.indices.get(index='{0}*'.format(ES_INDEX_VERSION_PREFIX)).keys():
+        suffix = index_name[len(ES_INDEX_VERSION_PREFIX):]
+        if suffix.isdigit():
+            versions.append(int(suffix))
+    return sorted(versions)
+
+
+def es_create_index(client):
+    """Create the first versioned index behind the alias if neither the alias nor an index is already there."""
+    if client.indices.exists(index=ES_INDEX_NAME):
+        return
+    client.options(ignore_status=400).indices.create(
+        index=versioned_index_name(1),
+        settings=ES_INDEX_SETTINGS,
+        mappings=ES_INDEX_MAPPINGS,
+        aliases={ES_INDEX_NAME: {}},
+    )
+
+
+def es_update_mappings(client):
+    """Add fields new in ES_INDEX_MAPPINGS to the index behind the alias. Existing docs get them on reindex."""
+    if client.indices.exists(index=ES_INDEX_NAME):
+        client.indices.put_mapping(index=ES_INDEX_NAME, properties=ES_INDEX_MAPPINGS['properties'])
+
+
+def es_create_index_for_bulk_load(client, version: int) -> str:
+    """Create a new versioned index with refresh and replicas turned off, not visible through the alias."""
+    index_name = versioned_index_name(version)
+    client.indices.create(
+        index=index_name,
+        settings={**ES_INDEX_SETTINGS, 'refresh_interval': '-1', 'number_of_replicas': 0},
+        mappings=ES_INDEX_MAPPINGS,
     )
+    return index_name
+
+
+def es_finish_bulk_load(client, index_name: str, number_of_replicas: int):
+    """Merge segments of a bulk loaded index and restore its search settings."""
+    client.options(request_timeout=3600).indices.forcemerge(index=index_name, max_num_segments=1)
+    client.indices.put_settings(
+        index=index_name,
+        settings={
+            'refresh_interval': ES_INDEX_SETTINGS['refresh_interval'],
+            'number_of_replicas': number_of_replicas,
+        },
+    )
+    client.indices.refresh(index=index_name)
+
+
+def es_swap_alias(client, index_name: str):
+    """Atomically point the alias to `index_name` and remove it from all other indices."""
+    actions = [{'add': {'index': index_name, 'alias': ES_INDEX_NAME}}]
+    if client.indices.exists_alias(name=ES_INDEX_NAME):
+        for old_index_name in client.indices.get_alias(name=ES_INDEX_NAME).keys():
+            actions.insert(0, {'remove': {'index': old_index_name, 'alias': ES_INDEX_NAME}})
+    elif client.indices.exists(index=ES_INDEX_NAME):
+        # Index created before versioning. An alias can't have the same name, so drop it in the same request.
+        actions.insert(0, {'remove_index': {'index': ES_INDEX_NAME}})
+    client.indices.update_aliases(actions=actions)
+
+
+def es_delete_old_versions(client, keep: int):
+    """Delete versioned indices not behind the alias, except for `keep` most recent ones."""
+    current = set(client.indices.get_alias(name=ES_INDEX_NAME).keys())
+    old_versions = [version for version in es_index_versions(client) if versioned_index_name(version) not in current]
+    # Slicing to a negative stop would delete from the wrong end when there are fewer old versions than `keep`.
+    for version in old_versions[:max(0, len(old_versions) - keep)]:
+        client.indices.delete(index=versioned_index_name(version))
+
 
 class Person(BaseModel):
     id: str
@@ -131,6 +210,8 @@ class EsDoc(BaseModel):
     id: str
     underscore_id: str = Field(alias='_id')
     imdb_rating: Optional[float] = None
+    creation_date: Optional[datetime.datetime] = None
+    type: Optional[str] = None
     genre: Optional[List[str]] = None
     title: Optional[str] = None
     description: Optional[str] = None
@@ -151,7 +232,12 @@ def validate_row_create_es_doc(row):
             'name': (string.split(':::'))[2],
         }
 
-    if row['persons'][0] is not None:
+    if 'persons_by_role' in row:
+        # Persons already split by role in PG.
+        directors, actors, writers = (
+            [Person(**p) for p in row['persons_by_role'][role]] for role in ('director', 'actor', 'writer')
+        )
+    elif row['persons'][0] is not None:
         persons = [_dict_from_str(p) for p in row['persons']]
         directors = [Person(id=p['id'], name=p['name']) for p in persons if p['role'] == 'director']
         actors = [Person(id=p['id'], name=p['name']) for p in persons if p['role'] == 'actor']
@@ -163,6 +249,8 @@ def validate_row_create_es_doc(row):
         id=row['id'],
         _id=row['id'],
         imdb_rating=row['imdb_rating'],
+        creation_date=row['creation_date'],
+        type=row['type'],
         genre=row['genre'],
         title=row['title'],
         description=row['description'],
@@ -174,11 +262,70 @@ def validate_row_create_es_doc(row):
     ).dict(by_alias=True)
 
 
-def generate_actions(pg_cursor, last_successful_load):
-    """Collect data on updated filmworks and generate ES actions"""
+def _split_persons_by_role(persons):
+    """Split `id:::role:::name` strings into directors, actors and writers in a single pass."""
+    directors, actors, writers = [], [], []
+    persons_by_role = {'director': directors, 'actor': actors, 'writer': writers}
+    for person in persons:
+        if person is None:
+            continue
+        person_id, role, name = person.split(':::', 2)
+        role_persons = persons_by_role.get(role)
+        if role_persons is not None:
+            role_persons.append({'id': person_id, 'name': name})
+    return directors, actors, writers
+
+
+def build_es_doc(row):
+    """
+    Convert one row from PG to a doc for ES, without validation.
+
+    Produces the same doc as `validate_row_create_es_doc`, but splits every person once,
+    buckets them by role in a single pass and builds plain dicts.
+    Persons that come already split by role from PG are passed through as is.
+    """
+    if 'persons_by_role' in row:
+        persons_by_role = row['persons_by_role']
+        directors, actors, writers = persons_by_role['director'], persons_by_role['actor'], persons_by_role['writer']
+    else:
+        directors, actors, writers = _split_persons_by_role(row['persons'])
+
+    return {
+        'id': row['id'],
+        '_id': row['id'],
+        'imdb_rating': row['imdb_rating'],
+        'creation_date': row['creation_date'],
+        'type': row['type'],
+        'genre': row['genre'],
+        'title': row['title'],
+        'description': row['description'],
+        'director': [p['name'] for p in directors],
+        'actors_names': [p['name'] for p in actors],
+        'writers_names': [p['name'] for p in writers],
+        'actors': actors,
+        'writers': writers,
+    }
+
+
+def es_delete_action(filmwork_id):
+    """Bulk action removing a deleted filmwork from ES."""
+    return {'_op_type': 'delete', '_id': filmwork_id}
+
+
+def es_doc_builder(validate=False):
+    """Function that converts a row from PG to a doc for ES, or a tombstone of a deleted filmwork to a delete action."""
+    create_es_doc = validate_row_create_es_doc if validate else build_es_doc
+
+    def build(row):
+        if row.get('deleted'):
+            return es_delete_action(row['id'])
+        return create_es_doc(row)
+
+    return build
+
 
-    # Select entities that have changed since LSL.
-    # TODO: refactor query to be more efficient
-    pg_cursor.execute(SELECT_UPDATED_FILMWORKS.format(last_successful_load))
-    for row in pg_cursor:
-        yield validate_row_create_es_doc(row)
+def generate_actions(pg_connection, filmwork_ids=None, validate=False, persons_as_json=True, fetch_size=100):
+    """Collect data on given filmworks (all filmworks if None) and generate ES actions"""
+    create_es_doc = es_doc_builder(validate)
+    for row in extract_filmworks(pg_connection, filmwork_ids, persons_as_json, fetch_size):
+        yield create_es_doc(row)
@@ -1,40 +1,205 @@
 """Main ETL module for transferring Filmworks from PG to ES."""
+import argparse
 import datetime
 import logging
+import multiprocessing
 import os
 import time
+from typing import Dict, List, Optional, Set
 
 import psycopg2
 from backoff import NoFilmworks, backoff
 from db_config import PG_CONNECTION_CREDENTIALS
 from db_queries import SELECT_ONE_FILMWORK
-from db_sqlite_functions import get_lsl_from_sqlite, save_lsl_to_sqlite
 from elasticsearch import Elasticsearch
-from elasticsearch.helpers import streaming_bulk
-from es import ES_INDEX_NAME, es_create_index, generate_actions
+from es import (ES_INDEX_NAME, es_create_index,
+                es_create_index_for_bulk_load, es_delete_old_versions,
+                es_doc_builder, es_finish_bulk_load, es_index_versions,
+                es_swap_alias, es_update_mappings)
+from etl_config import (ES_BULK_SETTINGS, ES_REINDEX_SETTINGS,
+                        ETL_CHECKPOINT_SETTINGS, ETL_NOTIFY_SETTINGS,
+                        ETL_PERSONS_AS_JSON, ETL_PIPELINE_SETTINGS,
+                        ETL_SHARD_SETTINGS, ETL_SKIP_UNCHANGED,
+                        ETL_STATE_SETTINGS, ETL_VALIDATE_DOCS)
+from extract import (CHANGE_SOURCES, INITIAL_WATERMARK, Watermark,
+                     delete_old_deletion_log, extract_changed_chunks,
+                     extract_filmworks, register_fast_json,
+                     select_all_filmwork_ids,
+                     select_filmwork_ids_for_changes,
+                     select_latest_watermarks)
+from loader import BulkStats, UnchangedDocsFilter, load
+from notify import ChangeListener
+from pipeline import run_pipeline
 from psycopg2.extras import RealDictCursor
-from run_once import get_lock
 from psycopg2.extensions import connection
+from run_once import get_lock
+from shards import SHARD_WORKER_APPLICATION_NAME, Shard, ShardClaims
+from state import (ScopedStateStore, StateStore, is_shared_state_store,
+                   open_state_store)
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 logger.addHandler(logging.StreamHandler())
 
 
+def transfer(
+    pg_connection: psycopg2.extensions.connection,
+    es_client: Elasticsearch,
+    filmwork_ids: Optional[Set[str]] = None,
+    index: str = ES_INDEX_NAME,
+    state: Optional[StateStore] = None,
+) -> BulkStats:
+    """
+    Extract given filmworks (all filmworks if None), transform them and load into ES index.
+
+    In pipeline mode extract, transform and load run in parallel threads, otherwise one after another.
+    With a `state` store docs unchanged since they were last loaded are skipped (ETL_SKIP_UNCHANGED).
+    """
+    fetch_size = ETL_PIPELINE_SETTINGS['fetch_size']
+    create_es_doc = es_doc_builder(ETL_VALIDATE_DOCS)
+    rows = extract_filmworks(pg_connection, filmwork_ids, ETL_PERSONS_AS_JSON, fetch_size)
+
+    def load_docs(docs):
+        if state is None or not ETL_SKIP_UNCHANGED:
+            return load(es_client=es_client, actions=docs, index=index, **ES_BULK_SETTINGS)
+        unchanged_docs_filter = UnchangedDocsFilter(state, batch_size=fetch_size)
+        bulk_stats = load(
+            es_client=es_client,
+            actions=unchanged_docs_filter.filter(docs),
+            index=index,
+            **ES_BULK_SETTINGS,
+        )
+        bulk_stats.skipped = unchanged_docs_filter.skipped
+        if not bulk_stats.errors:
+            unchanged_docs_filter.commit()
+        return bulk_stats
+
+    if not ETL_PIPELINE_SETTINGS['enabled']:
+        return load_docs(create_es_doc(row) for row in rows)
+
+    bulk_stats, _ = run_pipeline(
+        rows=rows,
+        transform=create_es_doc,
+        load=load_docs,
+        batch_size=fetch_size,
+        queue_size=ETL_PIPELINE_SETTINGS['queue_size'],
+    )
+    return bulk_stats
+
+
+def wait_for_changes(
+    listener: ChangeListener,
+    pg_connection: psycopg2.extensions.connection,
+    es_client: Elasticsearch,
+    wait_sec: float,
+    state: Optional[StateStore] = None,
+    shards: Optional[List[Shard]] = None,
+):
+    """
+    Wait for the next polling cycle, indexing filmworks affected by notified changes in the meantime.
+
+    With `shards` only filmworks of these shards are indexed, other workers take care of the rest.
+    """
+    deadline = time.monotonic() + wait_sec
+    while time.monotonic() < deadline:
+        changed_ids_by_table = listener.wait(deadline - time.monotonic())
+        if not changed_ids_by_table:
+            continue
+        with pg_connection:
+            filmwork_ids = select_filmwork_ids_for_changes(pg_connection, changed_ids_by_table)
+            if shards is not None:
+                filmwork_ids = set().union(*(shard.filter(filmwork_ids) for shard in shards))
+            bulk_stats = transfer(pg_connection, es_client, filmwork_ids=filmwork_ids, state=state)
+        logger.info('Updated {0} entries on notification, {1} unchanged, {2} failed.'.format(
+            bulk_stats.loaded, bulk_stats.skipped, bulk_stats.errors))
+
+
+def load_watermarks(state: StateStore, last_successful_load: datetime.datetime) -> Dict[str, Watermark]:
+    """
+    Watermarks of all source tables saved in the state store.
+
+    State saved before watermarks were introduced only has the LSL: start from it for every table.
+    """
+    watermarks = {
+        source: Watermark(*watermark) for source, watermark in state.get_watermarks().items()
+    }
+    if not watermarks and last_successful_load > INITIAL_WATERMARK.updated_at:
+        return {source: Watermark(last_successful_load, INITIAL_WATERMARK.id) for source in CHANGE_SOURCES}
+    return watermarks
+
+
+def update_index(
+    pg_connection: psycopg2.extensions.connection,
+    es_client: Elasticsearch,
+    state: StateStore,
+    last_successful_load: datetime.datetime,
+    shards: Optional[List[Shard]] = None,
+) -> BulkStats:
+    """
+    Load filmworks changed since the watermarks into ES chunk by chunk, saving the watermark of every loaded chunk.
+
+    With `shards` only their filmworks are loaded, and every shard keeps watermarks in its own scope.
+    Changes are detected once, from the oldest watermarks of the shards, and split between the shards behind them.
+    """
+    if shards is None:
+        scopes = {None: state}
+    else:
+        scopes = {shard: ScopedStateStore(state, shard.key) for shard in shards}
+    bulk_stats = BulkStats()
+    if not scopes:
+        return bulk_stats
+    watermarks = {shard: load_watermarks(scope, last_successful_load) for shard, scope in scopes.items()}
+    oldest_watermarks = {
+        source: min(shard_watermarks.get(source, INITIAL_WATERMARK) for shard_watermarks in watermarks.values())
+        for source in CHANGE_SOURCES
+    }
+    changed_chunks = extract_changed_chunks(
+        pg_connection,
+        oldest_watermarks,
+        page_size=ETL_CHECKPOINT_SETTINGS['page_size'],
+        lag_sec=ETL_CHECKPOINT_SETTINGS['lag_sec'],
+    )
+    for chunk in changed_chunks:
+        # Shards at or past the chunk's watermark have loaded its changes already.
+        behind = [
+            shard for shard in scopes
+            if watermarks[shard].get(chunk.source, INITIAL_WATERMARK) < chunk.watermark
+        ]
+        if shards is None:
+            filmwork_ids = chunk.filmwork_ids
+        else:
+            filmwork_ids = set().union(*(shard.filter(chunk.filmwork_ids) for shard in behind))
+        chunk_stats = transfer(pg_connection, es_client, filmwork_ids=filmwork_ids, state=state)
+        bulk_stats.add_chunk(chunk_stats)
+        if chunk_stats.errors:
+            # Failed documents will be picked up again next cycle, as the watermark is not moved.
+            break
+        for shard in behind:
+            scopes[shard].save_watermarks({chunk.source: chunk.watermark})
+    return bulk_stats
+
+
 @backoff()
-def main(pg_connection: psycopg2.extensions.connection, es_client: Elasticsearch, sqlite_db_path: str, frequency=60):
+def main(
+    pg_connection: psycopg2.extensions.connection,
+    es_client: Elasticsearch,
+    state: StateStore,
+    frequency=60,
+    listener: Optional[ChangeListener] = None,
+    shards: Optional[List[Shard]] = None,
+):
     """
     Main ETL function. Extracts movie data from PG, transforms it and pushes to ES index.
 
-    Searches PG for any movie-related entities that have changed since last cycle.
-    If any found, transforms them and loads into ES.
+    Searches PG for any movie-related entities that have changed since the watermark of their table.
+    If any found, transforms them and loads into ES, saving the watermark after every loaded chunk.
+    With a `listener`, changes notified by PG are loaded while waiting for the next cycle,
+    and the cycle itself remains as a safety net for missed notifications.
+    With `shards` only filmworks of these shards are loaded, other workers take care of the rest.
     """
 
-    # Get last successful load time from SQLite.
     logger.info('New cycle. Loading last successful load time...')
-    # Django uses UTC to store changed_at, we should use UTC too.
-    last_successful_load = datetime.datetime.fromisoformat(get_lsl_from_sqlite(sqlite_db_path)).replace(
-        tzinfo=datetime.timezone.utc)
+    last_successful_load = state.get_last_successful_load()
     logger.info('Last successful load = {0}'.format(last_successful_load))
 
     time_since_lsl = (datetime.datetime.now(datetime.timezone.utc) - last_successful_load).total_seconds()
@@ -43,12 +208,15 @@ def main(pg_connection: psycopg2.extensions.connection, es_client: Elasticsearch
             frequency,
             frequency - time_since_lsl,
         ))
-        time.sleep(frequency - time_since_lsl)
+        if listener is None:
+            time.sleep(frequency - time_since_lsl)
+        else:
+            wait_for_changes(listener, pg_connection, es_client, frequency - time_since_lsl, state, shards)
 
     start_time = datetime.datetime.now(datetime.timezone.utc)
     logger.info('Starting new extraction.')
     etl_successful = False
-    save_lsl_to_sqlite(start_time, etl_successful, sqlite_db_path)
+    state.save_load(start_time, etl_successful)
 
     logger.info('Reading data from PG.')
     with pg_connection:
@@ -60,64 +228,198 @@ def main(pg_connection: psycopg2.extensions.connection, es_client: Elasticsearch
             logger.info('=======================================')
             raise NoFilmworks('No filmworks in DB')
         else:  # DB is not empty
-            # Naming our cursor creates it serverside.
-            # That allows using a generator to read results and not load everything in memory.
-            pg_cursor = pg_connection.cursor(name='ETL_cursor')
-            # The number of rows that the client will pull down at a time from the server side cursor.
-            pg_cursor.itersize = 100
-
             logger.info('Creating ES index if not already present.')
             es_create_index(es_client)
 
-            # Updating ES index
             logger.info('Updating ES index...')
-            i = 0
-            streaming_blk = streaming_bulk(
-                client=es_client,
-                index=ES_INDEX_NAME,
-                actions=generate_actions(pg_cursor, last_successful_load),
-                max_retries=100,
-                initial_backoff=0.1,
-                max_backoff=10,
-            )
-            for ok, response in streaming_blk:
-                if not ok:
-                    logger.error('Error while creating/updating index in ES.')
-                logger.debug(response)
-                i += 1
-            etl_successful = True
-
-
+            bulk_stats = update_index(pg_connection, es_client, state, last_successful_load, shards)
+            etl_successful = bulk_stats.errors == 0
 
     if etl_successful:
-        logger.info('Done updating ES index. Updated {0} entries'.format(i))
+        logger.info('Done updating ES index. Updated {0} entries, skipped {1} unchanged.'.format(
+            bulk_stats.loaded, bulk_stats.skipped))
         logger.info('==========================================')
-    save_lsl_to_sqlite(start_time, etl_successful, sqlite_db_path)
+    else:
+        logger.error('Failed to update {0} of {1} entries in {2} chunks.'.format(
+            bulk_stats.errors,
+            bulk_stats.loaded + bulk_stats.errors,
+            bulk_stats.chunks,
+        ))
+    state.save_load(start_time, etl_successful)
+
+
+def reindex_shard(index_name: str, shard: Shard) -> BulkStats:
+    """Load all filmworks of a shard into the index. Runs in a reindex worker process, with its own connections."""
+    es_client = connect_es()
+    pg_connection = connect_pg()
+    try:
+        with pg_connection:
+            filmwork_ids = select_all_filmwork_ids(pg_connection, shard)
+            logger.info('Reindexing {0} filmworks of {1}...'.format(len(filmwork_ids), shard.key))
+            return transfer(pg_connection, es_client, filmwork_ids=filmwork_ids, index=index_name)
+    finally:
+        es_client.transport.close()
+        pg_connection.close()
+
+
+def reindex_all_shards(index_name: str, shard_count: int, processes: int) -> BulkStats:
+    """Load all filmworks into the index, with shards spread over parallel worker processes."""
+    bulk_stats = BulkStats()
+    # Spawned workers don't inherit the parent's PG and ES connections.
+    with multiprocessing.get_context('spawn').Pool(min(processes, shard_count)) as pool:
+        shard_args = [(index_name, Shard(index=shard_index, count=shard_count)) for shard_index in range(shard_count)]
+        for shard_stats in pool.starmap(reindex_shard, shard_args):
+            bulk_stats.add_stats(shard_stats)
+    return bulk_stats
+
+
+def reindex(pg_connection: psycopg2.extensions.connection, es_client: Elasticsearch, state: StateStore):
+    """
+    Full rebuild of the ES index without downtime.
+
+    Loads all filmworks into a new versioned index with refresh and replicas turned off,
+    then atomically switches the alias to it. Searches keep hitting the old index until the switch.
+    With ETL_SHARDS > 1 shards are loaded by ETL_REINDEX_PROCESSES processes at once.
+    """
+    shard_count = ETL_SHARD_SETTINGS['shards']
+    with pg_connection:
+        # Everything changed up to here will be in the new index.
+        latest_watermarks = select_latest_watermarks(pg_connection)
+    versions = es_index_versions(es_client)
+    index_name = es_create_index_for_bulk_load(es_client, max(versions, default=0) + 1)
+    logger.info('Reindexing all filmworks into {0}...'.format(index_name))
+    try:
+        if shard_count > 1:
+            bulk_stats = reindex_all_shards(index_name, shard_count, ETL_SHARD_SETTINGS['reindex_processes'])
+        else:
+            with pg_connection:
+                bulk_stats = transfer(pg_connection, es_client, index=index_name)
+        if bulk_stats.errors:
+            raise RuntimeError('Failed to index {0} filmworks into {1}'.format(bulk_stats.errors, index_name))
+        es_finish_bulk_load(es_client, index_name, ES_REINDEX_SETTINGS['number_of_replicas'])
+    except Exception:
+        logger.error('Reindex failed, deleting {0}.'.format(index_name))
+        es_client.indices.delete(index=index_name)
+        raise
+
+    es_swap_alias(es_client, index_name)
+    logger.info('Indexed {0} filmworks. Alias now points to {1}.'.format(bulk_stats.loaded, index_name))
+    es_delete_old_versions(es_client, keep=ES_REINDEX_SETTINGS['keep_old_versions'])
+    # Docs were reindexed without checking hashes. Saved hashes may not match the new index anymore.
+    state.clear_doc_hashes()
+    # Incremental cycles continue from the latest changes seen before the reindex.
+    state.save_watermarks(latest_watermarks)
+    if shard_count > 1:
+        for shard_index in range(shard_count):
+            shard = Shard(index=shard_index, count=shard_count)
+            ScopedStateStore(state, shard.key).save_watermarks(latest_watermarks)
+
+
+def connect_es() -> Elasticsearch:
+    return Elasticsearch(
+        hosts=os.environ.get('ES_HOST', 'http://127.0.0.1:9200'),
+        # Each bulk worker needs its own HTTP connection.
+        connections_per_node=max(10, ES_BULK_SETTINGS['workers']),
+    )
+
+
+def connect_pg(**kwargs) -> connection:
+    pg_connection = psycopg2.connect(**PG_CONNECTION_CREDENTIALS, cursor_factory=RealDictCursor, **kwargs)
+    register_fast_json(pg_connection)
+    return pg_connection
+
 
 @backoff()
 def etl_cycle():
     """
     Launches ETL cycle and manages PG and ES connections.
+
+    With ETL_SHARDS > 1 the worker rebalances its shards with other workers before every cycle.
     """
-    es_client = Elasticsearch(hosts=os.environ.get('ES_HOST', 'http://127.0.0.1:9200'))
-    pg_connection = psycopg2.connect(**PG_CONNECTION_CREDENTIALS, cursor_factory=RealDictCursor)
+    es_client = connect_es()
+    pg_connection = connect_pg()
+    state = open_state_store(ETL_STATE_SETTINGS['url'], ETL_STATE_SETTINGS['namespace'])
+    listener = None
+    if ETL_NOTIFY_SETTINGS['enabled']:
+        listener = ChangeListener(connect_pg(), ETL_NOTIFY_SETTINGS['debounce_sec'])
+    shard_claims = None
+    if ETL_SHARD_SETTINGS['shards'] > 1:
+        shard_claims = ShardClaims(
+            connect_pg(application_name=SHARD_WORKER_APPLICATION_NAME),
+            ETL_SHARD_SETTINGS['shards'],
+        )
+    next_housekeeping = time.monotonic()
     try:
+        es_update_mappings(es_client)
         while True:
+            if time.monotonic() >= next_housekeeping:
+                state.housekeeping()
+                delete_old_deletion_log(pg_connection, ETL_CHECKPOINT_SETTINGS['deletion_log_retention_days'])
+                next_housekeeping = time.monotonic() + ETL_STATE_SETTINGS['housekeeping_sec']
             main(
                 pg_connection=pg_connection,
                 es_client=es_client,
-                sqlite_db_path=os.environ.get('SQLITE_DB_PATH', 'etl_state/db.sqlite'),
-                frequency=os.environ.get('ETL_CYCLE_SEC', 6),
+                state=state,
+                frequency=int(os.environ.get('ETL_CYCLE_SEC', 6)),
+                listener=listener,
+                shards=None if shard_claims is None else shard_claims.rebalance(),
             )
     finally:
         logger.info("Closing PG and ES connections.")
         es_client.transport.close()
         pg_connection.close()  # `with` doesn't close the PG connection, we have to do it manually
+        state.close()
+        if listener is not None:
+            listener.pg_connection.close()
+        if shard_claims is not None:
+            shard_claims.close()
+
+
+@backoff(stop_at_border=True)
+def run_reindex():
+    """
+    Launches full reindex and manages PG and ES connections.
+    """
+    es_client = connect_es()
+    pg_connection = connect_pg()
+    state = open_state_store(ETL_STATE_SETTINGS['url'], ETL_STATE_SETTINGS['namespace'])
+    try:
+        reindex(pg_connection=pg_connection, es_client=es_client, state=state)
+    finally:
+        logger.info("Closing PG and ES connections.")
+        es_client.transport.close()
+        pg_connection.close()
+        state.close()
+
 
 if __name__ == '__main__':
-    # Ensure only one copy is running
-    get_lock('etl')
-    logger.info("Got the lock. We're the only ETL process running. Launching polling cycle.")
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        'mode',
+        nargs='?',
+        choices=('cycle', 'reindex'),
+        default='cycle',
+        help='cycle: continuously load changes (default), reindex: rebuild the whole index and exit',
+    )
+    args = parser.parse_args()
+
+    if ETL_SHARD_SETTINGS['shards'] > 1 and not is_shared_state_store(ETL_STATE_SETTINGS['url']):
+        # Watermarks of a shard must follow it to whichever worker takes it over.
+        parser.error('ETL_SHARDS > 1 needs a state store shared by all workers, set ETL_STATE_URL=redis://...')
+
+    if args.mode == 'cycle' and ETL_SHARD_SETTINGS['shards'] > 1:
+        # Sharded workers coordinate through PG, any number of them can run on any hosts.
+        logger.info('Launching polling cycle as one of the workers sharing {0} shards.'.format(
+            ETL_SHARD_SETTINGS['shards']))
+        etl_cycle()
+    else:
+        # Ensure only one copy is running
+        get_lock('etl')
+        if args.mode == 'reindex':
+            logger.info("Got the lock. We're the only ETL process running. Launching full reindex.")
+            run_reindex()
+        else:
+            logger.info("Got the lock. We're the only ETL process running. Launching polling cycle.")
 
-    # Start the ETL cycle
-    etl_cycle()
\ No newline at end of file
+            # Start the ETL cycle
+            etl_cycle()
\ No newline at end of file
@@ -0,0 +1,72 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ES_BULK_SETTINGS = {
+    # 1 worker streams everything through a single bulk request at a time.
+    # More workers send chunks of actions to ES in parallel threads.
+    'workers': int(os.environ.get('ES_BULK_WORKERS', 1)),
+    'chunk_size': int(os.environ.get('ES_BULK_CHUNK_SIZE', 500)),
+    'max_chunk_bytes': int(os.environ.get('ES_BULK_MAX_BYTES', 100 * 1024 * 1024)),
+}
+
+ES_REINDEX_SETTINGS = {
+    # Replicas to restore on the new index after the bulk load.
+    'number_of_replicas': int(os.environ.get('ES_NUMBER_OF_REPLICAS', 1)),
+    # Previous index versions kept after the alias swap, for a quick rollback.
+    'keep_old_versions': int(os.environ.get('ES_KEEP_OLD_INDEX_VERSIONS', 1)),
+}
+
+# Validate every doc with pydantic models before loading. Slower, useful for debugging.
+ETL_VALIDATE_DOCS = os.environ.get('ETL_VALIDATE_DOCS', False) == 'True'
+
+# Build persons JSON split by role in PG. False falls back to `id:::role:::name` strings parsed in Python.
+ETL_PERSONS_AS_JSON = os.environ.get('ETL_PERSONS_AS_JSON', 'True') == 'True'
+
+ETL_PIPELINE_SETTINGS = {
+    # Extract, transform and load in parallel threads connected by bounded queues.
+    'enabled': os.environ.get('ETL_PIPELINE', 'True') == 'True',
+    # Rows pulled from the PG server side cursor at a time, also the size of batches passed between stages.
+    'fetch_size': int(os.environ.get('ETL_FETCH_SIZE', 100)),
+    # Max batches waiting between two stages. A full queue blocks the stage before it.
+    'queue_size': int(os.environ.get('ETL_QUEUE_SIZE', 10)),
+}
+
+ETL_NOTIFY_SETTINGS = {
+    # Load changes notified by PG triggers between polling cycles.
+    'enabled': os.environ.get('ETL_NOTIFY', False) == 'True',
+    # Time to keep collecting notifications after the first one, to load a burst of edits at once.
+    'debounce_sec': float(os.environ.get('ETL_NOTIFY_DEBOUNCE_SEC', 0.5)),
+}
+
+ETL_CHECKPOINT_SETTINGS = {
+    # Changed rows of a source table per chunk. The table's watermark is saved after each loaded chunk.
+    'page_size': int(os.environ.get('ETL_CHECKPOINT_PAGE_SIZE', 1000)),
+    # Rows changed more recently are left for the next cycle, as transactions that set updated_at
+    # earlier may not be committed yet. Also covers clock skew between Django and PG hosts.
+    'lag_sec': float(os.environ.get('ETL_WATERMARK_LAG_SEC', 5)),
+    # Deletion log entries are kept this long. ETL stopped for longer needs a full reindex to catch up on deletions.
+    'deletion_log_retention_days': float(os.environ.get('ETL_DELETION_LOG_RETENTION_DAYS', 30)),
+}
+
+ETL_STATE_SETTINGS = {
+    # Where ETL keeps LSL and watermarks: a path to an SQLite file, `redis://host:port/db` or `memory://`.
+    'url': os.environ.get('ETL_STATE_URL', os.environ.get('SQLITE_DB_PATH', 'etl_state/db.sqlite')),
+    # Key prefix in a shared key-value store, one per pipeline.
+    'namespace': os.environ.get('ETL_STATE_NAMESPACE', 'etl'),
+    # How often old run records are cleaned up. Not done on every cycle, as it is not needed that often.
+    'housekeeping_sec': float(os.environ.get('ETL_STATE_HOUSEKEEPING_SEC', 24 * 60 * 60)),
+}
+
+ETL_SHARD_SETTINGS = {
+    # Filmworks are split into this many shards. With more than 1 several ETL workers can run at once,
+    # each taking a share of shards. Run a full reindex after changing it: new shards start from unsharded watermarks.
+    'shards': int(os.environ.get('ETL_SHARDS', 1)),
+    # Processes loading shards in parallel during a full reindex.
+    'reindex_processes': int(os.environ.get('ETL_REINDEX_PROCESSES', os.cpu_count() or 1)),
+}
+
+# Don't send docs that are the same as when they were last loaded, by their hashes kept in the state store.
+ETL_SKIP_UNCHANGED = os.environ.get('ETL_SKIP_UNCHANGED', 'True') == 'True'
@@ -0,0 +1,202 @@
+"""Staged extraction of changed filmworks from PG: change detection per table, then enrichment."""
+import datetime
+import json
+import logging
+import os
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set
+
+from db_queries import (DELETE_OLD_DELETION_LOG, SELECT_ALL_FILMWORK_IDS,
+                        SELECT_CHANGED_FILMWORKS_PAGE,
+                        SELECT_CHANGED_GENRE_FILMWORKS_PAGE,
+                        SELECT_CHANGED_GENRES_PAGE,
+                        SELECT_CHANGED_PERSON_FILMWORKS_PAGE,
+                        SELECT_CHANGED_PERSONS_PAGE,
+                        SELECT_DELETED_FILMWORKS_PAGE,
+                        SELECT_FILMWORK_IDS_BY_GENRE_IDS,
+                        SELECT_FILMWORK_IDS_BY_PERSON_IDS,
+                        SELECT_FILMWORKS_BY_IDS,
+                        SELECT_FILMWORKS_JSON_BY_IDS, SELECT_LATEST_CHANGE,
+                        SELECT_SHARD_FILMWORK_IDS)
+from psycopg2.extensions import connection
+from psycopg2.extras import register_default_jsonb
+from shards import Shard
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+logger.addHandler(logging.StreamHandler())
+
+# Max number of ids passed to a single `= ANY(...)` query.
+EXTRACT_BATCH_SIZE = int(os.environ.get('ETL_EXTRACT_BATCH_SIZE', 1000))
+
+# (source table, change detection query, expansion query).
+# Changes in film_work and m2m tables point to filmworks directly,
+# changes in person and genre are expanded to filmworks through the m2m tables.
+# Deleted rows don't show up in the tables, triggers log the affected filmworks into deletion_log.
+CHANGE_DETECTION_QUERIES = (
+    ('film_work', SELECT_CHANGED_FILMWORKS_PAGE, None),
+    ('person_film_work', SELECT_CHANGED_PERSON_FILMWORKS_PAGE, None),
+    ('genre_film_work', SELECT_CHANGED_GENRE_FILMWORKS_PAGE, None),
+    ('person', SELECT_CHANGED_PERSONS_PAGE, SELECT_FILMWORK_IDS_BY_PERSON_IDS),
+    ('genre', SELECT_CHANGED_GENRES_PAGE, SELECT_FILMWORK_IDS_BY_GENRE_IDS),
+    ('deletion_log', SELECT_DELETED_FILMWORKS_PAGE, None),
+)
+
+CHANGE_SOURCES = tuple(source for source, _, _ in CHANGE_DETECTION_QUERIES)
+
+
+class Watermark(NamedTuple):
+    """Position of the last loaded row of a source table. `id` breaks ties between equal `updated_at`."""
+    updated_at: datetime.datetime
+    id: str
+
+
+INITIAL_WATERMARK = Watermark(
+    updated_at=datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc),
+    id='00000000-0000-0000-0000-000000000000',
+)
+
+
+class ExtractedChunk(NamedTuple):
+    """Filmworks affected by one page of changes of a source table, and the watermark after the page."""
+    source: str
+    watermark: Watermark
+    filmwork_ids: Set[str]
+
+
+def register_fast_json(pg_connection: connection):
+    """Decode jsonb columns with orjson if it is installed, it is several times faster than json."""
+    register_default_jsonb(pg_connection, loads=orjson.loads if orjson else json.loads)
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[List]:
+    """Split iterable into lists of at most `size` elements."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _expand_to_filmwork_ids(pg_cursor, expand_query: str, ids: List[str]) -> Set[str]:
+    filmwork_ids = set()
+    for ids_batch in batched(ids, EXTRACT_BATCH_SIZE):
+        pg_cursor.execute(expand_query, {'ids': ids_batch})
+        filmwork_ids.update(row['id'] for row in pg_cursor)
+    return filmwork_ids
+
+
+def extract_changed_chunks(
+    pg_connection: connection,
+    watermarks: Dict[str, Watermark],
+    page_size: int,
+    lag_sec: float,
+) -> Iterator[ExtractedChunk]:
+    """
+    Page through changes of every source table after its watermark, in (updated_at, id) order.
+
+    Every page of at most `page_size` changed rows is expanded to the affected filmworks.
+    Once they are loaded, the chunk's watermark can be saved, so that a crash resumes from there.
+    """
+    for source, page_query, expand_query in CHANGE_DETECTION_QUERIES:
+        watermark = watermarks.get(source, INITIAL_WATERMARK)
+        while True:
+            with pg_connection.cursor() as pg_cursor:
+                pg_cursor.execute(page_query, {
+                    'updated_at': watermark.updated_at,
+                    'id': watermark.id,
+                    'lag_sec': lag_sec,
+                    'limit': page_size,
+                })
+                changes = pg_cursor.fetchall()
+                if not changes:
+                    break
+                ref_ids = {row['ref_id'] for row in changes}
+                if expand_query is None:
+                    filmwork_ids = ref_ids
+                else:
+                    filmwork_ids = _expand_to_filmwork_ids(pg_cursor, expand_query, sorted(ref_ids))
+            watermark = Watermark(updated_at=changes[-1]['updated_at'], id=changes[-1]['id'])
+            logger.debug('{0} changed rows in {1}, up to {2}.'.format(len(changes), source, watermark))
+            yield ExtractedChunk(source=source, watermark=watermark, filmwork_ids=filmwork_ids)
+            if len(changes) < page_size:
+                break
+
+
+def select_latest_watermarks(pg_connection: connection) -> Dict[str, Watermark]:
+    """Watermarks of the latest change in every source table."""
+    watermarks = {}
+    with pg_connection.cursor() as pg_cursor:
+        for source in CHANGE_SOURCES:
+            pg_cursor.execute(SELECT_LATEST_CHANGE.format(table=source))
+            row = pg_cursor.fetchone()
+            if row is not None:
+                watermarks[source] = Watermark(updated_at=row['updated_at'], id=row['id'])
+    return watermarks
+
+
+def select_filmwork_ids_for_changes(pg_connection: connection, changed_ids_by_table: Dict[str, Set[str]]) -> Set[str]:
+    """Find ids of filmworks affected by already known changes: {source table: changed ids}."""
+    filmwork_ids = set()
+    with pg_connection.cursor() as pg_cursor:
+        for table, _, expand_query in CHANGE_DETECTION_QUERIES:
+            changed_ids = sorted(changed_ids_by_table.get(table, ()))
+            if expand_query is None:
+                filmwork_ids.update(changed_ids)
+            elif changed_ids:
+                filmwork_ids.update(_expand_to_filmwork_ids(pg_cursor, expand_query, changed_ids))
+    return filmwork_ids
+
+
+def select_all_filmwork_ids(pg_connection: connection, shard: Optional[Shard] = None) -> Set[str]:
+    """Ids of all filmworks, or all filmworks of a shard, for a full reindex."""
+    with pg_connection.cursor() as pg_cursor:
+        if shard is None:
+            pg_cursor.execute(SELECT_ALL_FILMWORK_IDS)
+        else:
+            pg_cursor.execute(SELECT_SHARD_FILMWORK_IDS, {'shard_index': shard.index, 'shard_count': shard.count})
+        return {row['id'] for row in pg_cursor}
+
+
+def extract_filmworks(
+    pg_connection: connection,
+    filmwork_ids: Optional[Iterable[str]] = None,
+    persons_as_json: bool = True,
+    fetch_size: int = 100,
+) -> Iterator[dict]:
+    """
+    Read full filmwork data for the given ids (all filmworks if None), batch by batch.
+
+    With `persons_as_json` persons come as JSON split by role, otherwise as `id:::role:::name` strings.
+    Given ids that are no longer in PG come as `{'id': id, 'deleted': True}` tombstones.
+    """
+    if filmwork_ids is None:
+        filmwork_ids = select_all_filmwork_ids(pg_connection)
+    query = SELECT_FILMWORKS_JSON_BY_IDS if persons_as_json else SELECT_FILMWORKS_BY_IDS
+    for ids_batch in batched(sorted(filmwork_ids), EXTRACT_BATCH_SIZE):
+        found_ids = set()
+        # Naming our cursor creates it serverside.
+        # That allows using a generator to read results and not load everything in memory.
+        with pg_connection.cursor(name='ETL_cursor') as pg_cursor:
+            # The number of rows that the client will pull down at a time from the server side cursor.
+            pg_cursor.itersize = fetch_size
+            pg_cursor.execute(query, {'ids': ids_batch})
+            for row in pg_cursor:
+                found_ids.add(row['id'])
+                yield row
+        for filmwork_id in ids_batch:
+            if filmwork_id not in found_ids:
+                yield {'id': filmwork_id, 'deleted': True}
+
+
+def delete_old_deletion_log(pg_connection: connection, retention_days: float):
+    """Clean up deletion log entries old enough to be behind the watermarks of all workers."""
+    with pg_connection, pg_connection.cursor() as pg_cursor:
+        pg_cursor.execute(DELETE_OLD_DELETION_LOG, {'retention_days': retention_days})
+        logger.debug('Deleted {0} old deletion log entries.'.format(pg_cursor.rowcount))
@@ -0,0 +1,178 @@
+"""Load ES actions: serially via one streaming bulk or in chunks by parallel worker threads."""
+import hashlib
+import json
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Iterator
+
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import streaming_bulk
+from es import ES_INDEX_NAME
+from extract import batched
+from pydantic import BaseModel
+from state import StateStore
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+logger.addHandler(logging.StreamHandler())
+
+BULK_RETRY_OPTIONS = {
+    'max_retries': 100,
+    'initial_backoff': 0.1,
+    'max_backoff': 10,
+}
+
+
+class BulkStats(BaseModel):
+    loaded: int = 0
+    errors: int = 0
+    chunks: int = 0
+    # Docs not sent to ES, as they are the same as when they were last loaded.
+    skipped: int = 0
+
+    def add_chunk(self, chunk_stats: 'BulkStats'):
+        self.loaded += chunk_stats.loaded
+        self.errors += chunk_stats.errors
+        self.skipped += chunk_stats.skipped
+        self.chunks += 1
+
+    def add_stats(self, stats: 'BulkStats'):
+        self.loaded += stats.loaded
+        self.errors += stats.errors
+        self.skipped += stats.skipped
+        self.chunks += stats.chunks
+
+
+def doc_hash(doc: dict) -> str:
+    """Hash of a doc that doesn't depend on the order of its keys."""
+    if orjson is not None:
+        serialized = orjson.dumps(doc, option=orjson.OPT_SORT_KEYS, default=str)
+    else:
+        serialized = json.dumps(doc, sort_keys=True, separators=(',', ':'), default=str).encode()
+    return hashlib.blake2b(serialized, digest_size=16).hexdigest()
+
+
+class UnchangedDocsFilter:
+    """
+    Drops docs that are the same as when they were last loaded into ES, by their hashes kept in the state store.
+
+    Hashes of passed docs are only saved by `commit`, once the docs are loaded without errors.
+    """
+
+    def __init__(self, state: StateStore, batch_size: int):
+        self.state = state
+        self.batch_size = batch_size
+        self.new_hashes: Dict[str, str] = {}
+        self.skipped = 0
+
+    def filter(self, docs: Iterable[dict]) -> Iterator[dict]:
+        for batch in batched(docs, self.batch_size):
+            hashes = {doc['_id']: doc_hash(doc) for doc in batch}
+            saved_hashes = self.state.get_doc_hashes(list(hashes))
+            for doc in batch:
+                doc_id = doc['_id']
+                if saved_hashes.get(doc_id) == hashes[doc_id]:
+                    self.skipped += 1
+                    continue
+                self.new_hashes[doc_id] = hashes[doc_id]
+                yield doc
+
+    def commit(self):
+        self.state.save_doc_hashes(self.new_hashes)
+        self.new_hashes = {}
+
+
+def _stream_actions(
+    es_client: Elasticsearch,
+    actions: Iterable[dict],
+    chunk_size: int,
+    max_chunk_bytes: int,
+    index: str = ES_INDEX_NAME,
+):
+    """Send actions to ES and count successful and failed ones."""
+    stats = BulkStats()
+    streaming_blk = streaming_bulk(
+        client=es_client,
+        index=index,
+        actions=actions,
+        chunk_size=chunk_size,
+        max_chunk_bytes=max_chunk_bytes,
+        raise_on_error=False,
+        **BULK_RETRY_OPTIONS,
+    )
+    for ok, response in streaming_blk:
+        # Deleting a doc that is already gone from ES is fine.
+        if ok or response.get('delete', {}).get('status') == 404:
+            stats.loaded += 1
+        else:
+            logger.error('Error while creating/updating index in ES.')
+            stats.errors += 1
+        logger.debug(response)
+    return stats
+
+
+def load_serial(
+    es_client: Elasticsearch,
+    actions: Iterable[dict],
+    chunk_size: int,
+    max_chunk_bytes: int,
+    index: str = ES_INDEX_NAME,
+):
+    """Load all actions through a single streaming bulk, one request at a time."""
+    stats = _stream_actions(es_client, actions, chunk_size, max_chunk_bytes, index)
+    stats.chunks = 1
+    return stats
+
+
+def _load_chunk(es_client: Elasticsearch, chunk_number: int, chunk: list, max_chunk_bytes: int, index: str):
+    chunk_stats = _stream_actions(es_client, chunk, len(chunk), max_chunk_bytes, index)
+    if chunk_stats.errors:
+        logger.error('Chunk {0}: {1} of {2} actions failed.'.format(chunk_number, chunk_stats.errors, len(chunk)))
+    return chunk_stats
+
+
+def load_parallel(
+    es_client: Elasticsearch,
+    actions: Iterable[dict],
+    workers: int,
+    chunk_size: int,
+    max_chunk_bytes: int,
+    index: str = ES_INDEX_NAME,
+):
+    """
+    Load actions in chunks of `chunk_size` by `workers` threads.
+
+    At most 2 * `workers` chunks are kept in memory, so a slow ES slows down reading from PG.
+    Each chunk is retried and accounted for separately.
+    """
+    stats = BulkStats()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='es_bulk') as executor:
+        in_flight = set()
+        for chunk_number, chunk in enumerate(batched(actions, chunk_size)):
+            if len(in_flight) >= workers * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stats.add_chunk(future.result())
+            in_flight.add(executor.submit(_load_chunk, es_client, chunk_number, chunk, max_chunk_bytes, index))
+        for future in wait(in_flight).done:
+            stats.add_chunk(future.result())
+    return stats
+
+
+def load(
+    es_client: Elasticsearch,
+    actions: Iterable[dict],
+    workers: int,
+    chunk_size: int,
+    max_chunk_bytes: int,
+    index: str = ES_INDEX_NAME,
+):
+    """Load actions to ES with the serial or the parallel loader depending on the number of workers."""
+    if workers > 1:
+        return load_parallel(es_client, actions, workers, chunk_size, max_chunk_bytes, index)
+    return load_serial(es_client, actions, chunk_size, max_chunk_bytes, index)
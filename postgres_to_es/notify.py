@@ -0,0 +1,62 @@
+"""Listen to content change notifications sent by PG triggers."""
+import logging
+import select
+import time
+from collections import defaultdict
+from typing import Dict, Set
+
+from psycopg2.extensions import connection
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+logger.addHandler(logging.StreamHandler())
+
+# Channel used by the content.notify_content_change() trigger, payload is `table:id`.
+NOTIFY_CHANNEL = 'content_changes'
+
+
+class ChangeListener:
+    """Receives change notifications on a dedicated autocommit PG connection."""
+
+    def __init__(self, pg_connection: connection, debounce_sec: float):
+        self.pg_connection = pg_connection
+        self.debounce_sec = debounce_sec
+        self.pg_connection.set_session(autocommit=True)
+        with self.pg_connection.cursor() as pg_cursor:
+            pg_cursor.execute('LISTEN {0};'.format(NOTIFY_CHANNEL))
+            # Triggers notify only in sessions with this setting, it is set for the whole database.
+            pg_cursor.execute("SELECT current_setting('content.notify', true) AS notify;")
+            if pg_cursor.fetchone()['notify'] != 'on':
+                logger.warning(
+                    'Content change triggers are off, run `ALTER DATABASE <name> SET content.notify = on`. '
+                    'Changes are loaded by polling only.'
+                )
+
+    def _socket_ready(self, timeout: float) -> bool:
+        return bool(select.select([self.pg_connection], [], [], max(timeout, 0))[0])
+
+    def _drain(self, changed_ids_by_table: Dict[str, Set[str]]):
+        self.pg_connection.poll()
+        while self.pg_connection.notifies:
+            notify = self.pg_connection.notifies.pop(0)
+            table, _, entity_id = notify.payload.partition(':')
+            changed_ids_by_table[table].add(entity_id)
+
+    def wait(self, timeout: float) -> Dict[str, Set[str]]:
+        """
+        Wait up to `timeout` seconds for changes on the connection socket.
+
+        After the first notification keeps collecting for `debounce_sec`, so that a burst of edits
+        is coalesced into one update. Returns {source table: changed ids}, empty if nothing changed.
+        """
+        changed_ids_by_table = defaultdict(set)
+        if not self._socket_ready(timeout):
+            return changed_ids_by_table
+        debounce_until = time.monotonic() + self.debounce_sec
+        self._drain(changed_ids_by_table)
+        while time.monotonic() < debounce_until and self._socket_ready(debounce_until - time.monotonic()):
+            self._drain(changed_ids_by_table)
+        logger.debug('Got notifications for {0} changed rows.'.format(
+            sum(len(ids) for ids in changed_ids_by_table.values()),
+        ))
+        return changed_ids_by_table
@@ -0,0 +1,191 @@
+"""Run extract, transform and load stages in parallel threads connected by bounded queues."""
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Iterator, List
+
+from extract import batched
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+logger.addHandler(logging.StreamHandler())
+
+# How often a blocked stage checks whether the pipeline was stopped.
+STOP_CHECK_INTERVAL_SEC = 0.1
+
+_DONE = object()
+
+
+class StageStats(BaseModel):
+    """
+    Throughput counters of one stage.
+
+    `busy_sec` is time spent doing the stage's own work,
+    `input_wait_sec` and `output_wait_sec` are time spent blocked on the upstream and downstream stages.
+    The bottleneck is the stage that is busy most of the time and rarely waits for its input.
+    """
+    name: str
+    items: int = 0
+    busy_sec: float = 0
+    input_wait_sec: float = 0
+    output_wait_sec: float = 0
+
+    def __str__(self):
+        rate = self.items / self.busy_sec if self.busy_sec else 0
+        return (
+            '{0}: {1} items, busy {2:.2f}s ({3:.0f} items/s), '
+            'waited for input {4:.2f}s, for output {5:.2f}s'
+        ).format(self.name, self.items, self.busy_sec, rate, self.input_wait_sec, self.output_wait_sec)
+
+
+class _Failure:
+    """Exception raised in a stage, passed downstream to be re-raised in the calling thread."""
+
+    def __init__(self, exception: BaseException):
+        self.exception = exception
+
+
+class PipelineStopped(Exception):
+    pass
+
+
+def _put(out_queue: queue.Queue, item, stop: threading.Event):
+    while True:
+        if stop.is_set():
+            raise PipelineStopped()
+        try:
+            return out_queue.put(item, timeout=STOP_CHECK_INTERVAL_SEC)
+        except queue.Full:
+            continue
+
+
+def _get(in_queue: queue.Queue, stop: threading.Event):
+    while True:
+        if stop.is_set():
+            raise PipelineStopped()
+        try:
+            return in_queue.get(timeout=STOP_CHECK_INTERVAL_SEC)
+        except queue.Empty:
+            continue
+
+
+def _fail(out_queue: queue.Queue, exception: BaseException, stop: threading.Event):
+    try:
+        _put(out_queue, _Failure(exception), stop)
+    except PipelineStopped:
+        pass
+
+
+def _extract_stage(rows: Iterable[dict], batch_size: int, out_queue: queue.Queue, stop: threading.Event, stats):
+    try:
+        batches = batched(rows, batch_size)
+        while True:
+            started = time.perf_counter()
+            batch = next(batches, None)
+            stats.busy_sec += time.perf_counter() - started
+            if batch is None:
+                break
+            stats.items += len(batch)
+            started = time.perf_counter()
+            _put(out_queue, batch, stop)
+            stats.output_wait_sec += time.perf_counter() - started
+        _put(out_queue, _DONE, stop)
+    except PipelineStopped:
+        return
+    except BaseException as e:
+        _fail(out_queue, e, stop)
+    finally:
+        # Close the rows generator in this thread, so that the PG cursor is not left open.
+        close_rows = getattr(rows, 'close', None)
+        if close_rows is not None:
+            close_rows()
+
+
+def _transform_stage(transform, in_queue: queue.Queue, out_queue: queue.Queue, stop: threading.Event, stats):
+    try:
+        while True:
+            started = time.perf_counter()
+            batch = _get(in_queue, stop)
+            stats.input_wait_sec += time.perf_counter() - started
+            if batch is _DONE or isinstance(batch, _Failure):
+                _put(out_queue, batch, stop)
+                return
+            started = time.perf_counter()
+            docs = [transform(row) for row in batch]
+            stats.busy_sec += time.perf_counter() - started
+            stats.items += len(docs)
+            started = time.perf_counter()
+            _put(out_queue, docs, stop)
+            stats.output_wait_sec += time.perf_counter() - started
+    except PipelineStopped:
+        return
+    except BaseException as e:
+        _fail(out_queue, e, stop)
+
+
+def _consume(in_queue: queue.Queue, stop: threading.Event, stats) -> Iterator[dict]:
+    while True:
+        started = time.perf_counter()
+        docs = _get(in_queue, stop)
+        stats.input_wait_sec += time.perf_counter() - started
+        if docs is _DONE:
+            return
+        if isinstance(docs, _Failure):
+            raise docs.exception
+        stats.items += len(docs)
+        yield from docs
+
+
+def run_pipeline(
+    rows: Iterable[dict],
+    transform: Callable[[dict], dict],
+    load: Callable[[Iterable[dict]], object],
+    batch_size: int,
+    queue_size: int,
+):
+    """
+    Extract rows, transform them to docs and load docs, with every stage in its own thread.
+
+    Stages pass batches of `batch_size` items through queues holding at most `queue_size` batches,
+    so a slow stage blocks the ones before it instead of piling up data in memory.
+    `load` runs in the calling thread. Errors in any stage are re-raised there.
+    Returns the result of `load` and stats of every stage.
+    """
+    stop = threading.Event()
+    rows_queue = queue.Queue(maxsize=queue_size)
+    docs_queue = queue.Queue(maxsize=queue_size)
+    extract_stats = StageStats(name='extract')
+    transform_stats = StageStats(name='transform')
+    load_stats = StageStats(name='load')
+    threads = [
+        threading.Thread(
+            target=_extract_stage,
+            args=(rows, batch_size, rows_queue, stop, extract_stats),
+            name='etl_extract',
+            daemon=True,
+        ),
+        threading.Thread(
+            target=_transform_stage,
+            args=(transform, rows_queue, docs_queue, stop, transform_stats),
+            name='etl_transform',
+            daemon=True,
+        ),
+    ]
+    for thread in threads:
+        thread.start()
+
+    started = time.perf_counter()
+    try:
+        result = load(_consume(docs_queue, stop, load_stats))
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    load_stats.busy_sec = time.perf_counter() - started - load_stats.input_wait_sec
+
+    stage_stats: List[StageStats] = [extract_stats, transform_stats, load_stats]
+    for stats in stage_stats:
+        logger.info(str(stats))
+    return result, stage_stats
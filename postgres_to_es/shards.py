@@ -0,0 +1,88 @@
+"""Partitioning of filmworks into shards, and claiming shards by ETL workers through PG advisory locks."""
+import logging
+import math
+import random
+import uuid
+from typing import List, NamedTuple, Set
+
+from db_queries import COUNT_LIVE_WORKERS, TRY_LOCK_SHARD, UNLOCK_SHARD
+from psycopg2.extensions import connection
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+logger.addHandler(logging.StreamHandler())
+
+# First key of the advisory locks taking shards, so that they don't clash with other locks in the DB.
+SHARD_LOCK_CLASS = 0x45544C  # 'ETL'
+
+# PG application name of the worker connections holding shard locks, used to count live workers.
+SHARD_WORKER_APPLICATION_NAME = 'etl_shard_worker'
+
+
+class Shard(NamedTuple):
+    """One of `count` parts of filmworks. Matches SELECT_SHARD_FILMWORK_IDS."""
+    index: int
+    count: int
+
+    @property
+    def key(self) -> str:
+        """Name of the shard, under which its watermarks are saved."""
+        return 'shard{0}of{1}'.format(self.index, self.count)
+
+    def owns(self, filmwork_id) -> bool:
+        return (uuid.UUID(str(filmwork_id)).int & 0xFFFFFFFF) % self.count == self.index
+
+    def filter(self, filmwork_ids: Set[str]) -> Set[str]:
+        return {filmwork_id for filmwork_id in filmwork_ids if self.owns(filmwork_id)}
+
+
+class ShardClaims:
+    """
+    Shards held by this worker.
+
+    Shards are taken with session level advisory locks on a dedicated PG connection.
+    If a worker dies, PG drops its connection and its locks, and live workers take the shards over.
+    Every worker aims at an equal share of shards, so shards are also given away when new workers join.
+    """
+
+    def __init__(self, pg_connection: connection, shard_count: int):
+        # The connection must be opened with application_name=SHARD_WORKER_APPLICATION_NAME.
+        self.pg_connection = pg_connection
+        self.pg_connection.autocommit = True
+        self.shard_count = shard_count
+        self.owned: Set[int] = set()
+        # Workers start looking for free shards in different places, so that they don't all race for the same ones.
+        self.offset = random.randrange(shard_count)
+
+    def rebalance(self) -> List[Shard]:
+        """Release shards above this worker's share and take free ones up to it. Returns held shards."""
+        with self.pg_connection.cursor() as pg_cursor:
+            pg_cursor.execute(COUNT_LIVE_WORKERS, {'application_name': SHARD_WORKER_APPLICATION_NAME})
+            workers = max(1, pg_cursor.fetchone()['workers'])
+            share = math.ceil(self.shard_count / workers)
+
+            while len(self.owned) > share:
+                shard_index = max(self.owned)
+                pg_cursor.execute(UNLOCK_SHARD, {'lock_class': SHARD_LOCK_CLASS, 'shard_index': shard_index})
+                self.owned.remove(shard_index)
+                logger.info('Released shard {0} to other workers.'.format(shard_index))
+
+            for step in range(self.shard_count):
+                if len(self.owned) >= share:
+                    break
+                shard_index = (self.offset + step) % self.shard_count
+                if shard_index in self.owned:
+                    continue
+                pg_cursor.execute(TRY_LOCK_SHARD, {'lock_class': SHARD_LOCK_CLASS, 'shard_index': shard_index})
+                if pg_cursor.fetchone()['locked']:
+                    self.owned.add(shard_index)
+                    logger.info('Took shard {0}.'.format(shard_index))
+
+        logger.debug('{0} live workers, holding shards {1} of {2}.'.format(
+            workers, sorted(self.owned), self.shard_count))
+        return [Shard(index=shard_index, count=self.shard_count) for shard_index in sorted(self.owned)]
+
+    def close(self):
+        """Closing the connection releases all held shards."""
+        self.owned.clear()
+        self.pg_connection.close()
@@ -0,0 +1,304 @@
+"""ETL state stores: last successful load and watermarks of source tables."""
+import datetime
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from db_queries import (CREATE_DOC_HASHES_TABLE, CREATE_TABLE,
+                        CREATE_WATERMARKS_TABLE, DELETE_DOC_HASHES,
+                        DELETE_OLD_STATES, SELECT_DOC_HASHES,
+                        SELECT_LAST_SUCCESSFUL_LOAD_TIME, SELECT_WATERMARKS,
+                        UPSERT_DOC_HASH, UPSERT_LAST_SUCCESSFUL_LOAD_TIME,
+                        UPSERT_WATERMARK)
+from extract import batched
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+logger.addHandler(logging.StreamHandler())
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Max number of ids in a single SQLite query, below SQLITE_MAX_VARIABLE_NUMBER of older SQLite versions.
+SQLITE_MAX_IDS = 500
+
+# URL schemes of Redis servers, the only stores shared by ETL workers.
+SHARED_STATE_SCHEMES = ('redis', 'rediss', 'unix')
+
+# {source table: (updated_at, id)}
+Watermarks = Dict[str, Tuple[datetime.datetime, str]]
+
+
+class StateStore(ABC):
+    """Where ETL keeps its progress between cycles and restarts."""
+
+    @abstractmethod
+    def get_last_successful_load(self) -> datetime.datetime:
+        """Start time of the last successful cycle, 1 Jan 1970 if there was none."""
+
+    @abstractmethod
+    def save_load(self, load_time: datetime.datetime, successful: bool):
+        """Save start time of a cycle and whether it was successful."""
+
+    @abstractmethod
+    def get_watermarks(self) -> Watermarks:
+        """(updated_at, id) of the last loaded row of every source table."""
+
+    @abstractmethod
+    def save_watermarks(self, watermarks: Watermarks):
+        """Save watermarks of one or more source tables in one write."""
+
+    @abstractmethod
+    def get_doc_hashes(self, doc_ids: List[str]) -> Dict[str, str]:
+        """Hashes of the given docs as last loaded into ES. Docs never loaded are missing."""
+
+    @abstractmethod
+    def save_doc_hashes(self, doc_hashes: Dict[str, str]):
+        """Save hashes of docs successfully loaded into ES."""
+
+    @abstractmethod
+    def clear_doc_hashes(self):
+        """Forget all doc hashes, e.g. after the index was rebuilt."""
+
+    def housekeeping(self):
+        """Periodic cleanup, kept off the hot path of ETL cycles."""
+
+    def close(self):
+        """Release connections held by the store."""
+
+
+class SQLiteStateStore(StateStore):
+    """State in a local SQLite file, over one connection kept open in WAL mode."""
+
+    def __init__(self, db_path: str):
+        self.connection = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.connection.execute('PRAGMA journal_mode=WAL;')
+        # In WAL mode NORMAL is still durable against application crashes, and does not fsync on every commit.
+        self.connection.execute('PRAGMA synchronous=NORMAL;')
+        self.connection.execute(CREATE_TABLE)
+        self.connection.execute(CREATE_WATERMARKS_TABLE)
+        self.connection.execute(CREATE_DOC_HASHES_TABLE)
+
+    def get_last_successful_load(self) -> datetime.datetime:
+        with self.lock:
+            row = self.connection.execute(SELECT_LAST_SUCCESSFUL_LOAD_TIME).fetchone()
+        if row is None:
+            logger.debug('No saved LSL found. Defaulting to 1 Jan 1970.')
+            return EPOCH
+        # Django uses UTC to store changed_at, we should use UTC too.
+        return datetime.datetime.fromisoformat(row[0]).replace(tzinfo=datetime.timezone.utc)
+
+    def save_load(self, load_time: datetime.datetime, successful: bool):
+        now = datetime.datetime.now().isoformat(timespec='seconds')
+        with self.lock:
+            self.connection.execute(
+                UPSERT_LAST_SUCCESSFUL_LOAD_TIME,
+                (load_time.isoformat(timespec='seconds'), successful, now),
+            )
+
+    def get_watermarks(self) -> Watermarks:
+        with self.lock:
+            rows = self.connection.execute(SELECT_WATERMARKS).fetchall()
+        return {
+            source: (datetime.datetime.fromisoformat(updated_at), row_id)
+            for source, updated_at, row_id in rows
+        }
+
+    def save_watermarks(self, watermarks: Watermarks):
+        # Microseconds are kept, so that rows changed within the same second are told apart.
+        with self.lock, self.connection:
+            self.connection.execute('BEGIN;')
+            self.connection.executemany(
+                UPSERT_WATERMARK,
+                [(source, updated_at.isoformat(), str(row_id)) for source, (updated_at, row_id) in watermarks.items()],
+            )
+
+    def get_doc_hashes(self, doc_ids: List[str]) -> Dict[str, str]:
+        doc_hashes = {}
+        with self.lock:
+            for ids_batch in batched(doc_ids, SQLITE_MAX_IDS):
+                query = SELECT_DOC_HASHES.format(placeholders=', '.join('?' * len(ids_batch)))
+                doc_hashes.update(self.connection.execute(query, ids_batch).fetchall())
+        return doc_hashes
+
+    def save_doc_hashes(self, doc_hashes: Dict[str, str]):
+        with self.lock, self.connection:
+            self.connection.execute('BEGIN;')
+            self.connection.executemany(UPSERT_DOC_HASH, doc_hashes.items())
+
+    def clear_doc_hashes(self):
+        with self.lock:
+            self.connection.execute(DELETE_DOC_HASHES)
+
+    def housekeeping(self):
+        with self.lock:
+            self.connection.execute(DELETE_OLD_STATES)
+
+    def close(self):
+        self.connection.close()
+
+
+class InMemoryKeyValue:
+    """Minimal in-process stand-in for the subset of the Redis client API used by KeyValueStateStore."""
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def get(self, name: str) -> Optional[bytes]:
+        with self.lock:
+            return self.data.get(name)
+
+    def set(self, name: str, value: str):
+        with self.lock:
+            self.data[name] = value.encode()
+
+    def hgetall(self, name: str) -> Dict[bytes, bytes]:
+        with self.lock:
+            return dict(self.data.get(name, {}))
+
+    def hset(self, name: str, mapping: Dict[str, str]):
+        with self.lock:
+            self.data.setdefault(name, {}).update({
+                field.encode(): value.encode() for field, value in mapping.items()
+            })
+
+    def hmget(self, name: str, keys: List[str]) -> List[Optional[bytes]]:
+        with self.lock:
+            hash_data = self.data.get(name, {})
+            return [hash_data.get(key.encode()) for key in keys]
+
+    def delete(self, name: str):
+        with self.lock:
+            self.data.pop(name, None)
+
+    def close(self):
+        pass
+
+
+class KeyValueStateStore(StateStore):
+    """
+    State in a Redis-compatible key-value store, shared by many ETL processes.
+
+    Keys are prefixed with `namespace`, so that pipelines sharing a store don't clash.
+    All watermarks live in one hash, so saving any number of them is a single write.
+    """
+
+    def __init__(self, client, namespace: str = 'etl'):
+        self.client = client
+        self.last_successful_load_key = '{0}:last_successful_load'.format(namespace)
+        self.watermarks_key = '{0}:watermarks'.format(namespace)
+        self.doc_hashes_key = '{0}:doc_hashes'.format(namespace)
+
+    def get_last_successful_load(self) -> datetime.datetime:
+        value = self.client.get(self.last_successful_load_key)
+        if value is None:
+            logger.debug('No saved LSL found. Defaulting to 1 Jan 1970.')
+            return EPOCH
+        return datetime.datetime.fromisoformat(value.decode())
+
+    def save_load(self, load_time: datetime.datetime, successful: bool):
+        if successful:
+            self.client.set(self.last_successful_load_key, load_time.isoformat(timespec='seconds'))
+
+    def get_watermarks(self) -> Watermarks:
+        watermarks = {}
+        for source, value in self.client.hgetall(self.watermarks_key).items():
+            updated_at, _, row_id = value.decode().partition('|')
+            watermarks[source.decode()] = (datetime.datetime.fromisoformat(updated_at), row_id)
+        return watermarks
+
+    def save_watermarks(self, watermarks: Watermarks):
+        self.client.hset(self.watermarks_key, mapping={
+            source: '{0}|{1}'.format(updated_at.isoformat(), row_id)
+            for source, (updated_at, row_id) in watermarks.items()
+        })
+
+    def get_doc_hashes(self, doc_ids: List[str]) -> Dict[str, str]:
+        if not doc_ids:
+            return {}
+        values = self.client.hmget(self.doc_hashes_key, doc_ids)
+        return {doc_id: value.decode() for doc_id, value in zip(doc_ids, values) if value is not None}
+
+    def save_doc_hashes(self, doc_hashes: Dict[str, str]):
+        if doc_hashes:
+            self.client.hset(self.doc_hashes_key, mapping=doc_hashes)
+
+    def clear_doc_hashes(self):
+        self.client.delete(self.doc_hashes_key)
+
+    def close(self):
+        self.client.close()
+
+
+class ScopedStateStore(StateStore):
+    """
+    View of a store, in which watermarks are kept under their own scope, e.g. of one shard.
+
+    LSL is shared with the underlying store. Sources without watermarks in the scope yet start from the unscoped ones.
+    """
+
+    def __init__(self, store: StateStore, scope: str):
+        self.store = store
+        self.prefix = '{0}:'.format(scope)
+
+    def get_last_successful_load(self) -> datetime.datetime:
+        return self.store.get_last_successful_load()
+
+    def save_load(self, load_time: datetime.datetime, successful: bool):
+        self.store.save_load(load_time, successful)
+
+    def get_watermarks(self) -> Watermarks:
+        all_watermarks = self.store.get_watermarks()
+        watermarks = {source: watermark for source, watermark in all_watermarks.items() if ':' not in source}
+        watermarks.update({
+            source[len(self.prefix):]: watermark
+            for source, watermark in all_watermarks.items()
+            if source.startswith(self.prefix)
+        })
+        return watermarks
+
+    def save_watermarks(self, watermarks: Watermarks):
+        self.store.save_watermarks({self.prefix + source: watermark for source, watermark in watermarks.items()})
+
+    # Doc ids are unique across scopes, doc hashes are shared.
+
+    def get_doc_hashes(self, doc_ids: List[str]) -> Dict[str, str]:
+        return self.store.get_doc_hashes(doc_ids)
+
+    def save_doc_hashes(self, doc_hashes: Dict[str, str]):
+        self.store.save_doc_hashes(doc_hashes)
+
+    def clear_doc_hashes(self):
+        self.store.clear_doc_hashes()
+
+
+def is_shared_state_store(url: str) -> bool:
+    """Whether the store given by URL is seen by ETL workers in other processes and on other hosts."""
+    return urlparse(url).scheme in SHARED_STATE_SCHEMES
+
+
+def open_state_store(url: str, namespace: str = 'etl') -> StateStore:
+    """
+    Open the state store given by URL.
+
+    `redis://host:port/db` - Redis or any server speaking its protocol (needs the `redis` package),
+    `memory://` - in-process store that is lost on restart, for tests and benchmarks,
+    anything else is a path to an SQLite file.
+    """
+    scheme = urlparse(url).scheme
+    if scheme in SHARED_STATE_SCHEMES:
+        if redis is None:
+            raise RuntimeError('Install the redis package to keep ETL state in {0}'.format(url))
+        return KeyValueStateStore(redis.Redis.from_url(url), namespace)
+    if scheme == 'memory':
+        return KeyValueStateStore(InMemoryKeyValue(), namespace)
+    return SQLiteStateStore(url)